@@ -0,0 +1,116 @@
+# benchmark.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Timing benchmarks for the adversarial search agents of the multi-agent project.
+
+Run one benchmark by name, for example:
+
+> python benchmark.py parallel --layout mediumClassic --depths 3,4 --workers 4,8,16
+"""
+
+import time
+import util
+
+
+def timed(function, *args):
+    "Returns the number of seconds function(*args) takes to run"
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def benchmarkParallel(layoutName, agentNames, depths, workerCounts, numMoves, evalFn):
+    """
+    Times getAction of the minimax and expectimax agents with one process and
+    with pools of each number of workers, on the first numMoves states of a
+    game on the layout in which Pacman plays the sequential agent's moves and
+    every ghost plays its first legal move.  Reports seconds per move and the
+    speedup over one process; every worker count must choose the same moves.
+    """
+    import layout
+    import multiAgents
+    import pacman
+
+    print '%-16s %6s %8s %12s %10s' % ('agent', 'depth', 'workers', 'time/move', 'speedup')
+    for agentName in agentNames:
+        agentClass = util.lookup(agentName, vars(multiAgents))
+        for depth in depths:
+            sequential = agentClass(evalFn=evalFn, depth=str(depth))
+            states, actions = [], []
+            state = pacman.GameState()
+            state.initialize(layout.getLayout(layoutName), 1000)
+            while len(states) < numMoves and not (state.isWin() or state.isLose()):
+                states.append(state)
+                actions.append(sequential.getAction(state))
+                state = state.generateSuccessor(0, actions[-1])
+                for ghost in range(1, state.getNumAgents()):
+                    if state.isWin() or state.isLose():
+                        break
+                    state = state.generateSuccessor(ghost, state.getLegalActions(ghost)[0])
+
+            seconds = timed(lambda: [sequential.getAction(state) for state in states]) / len(states)
+            print '%-16s %6d %8d %12.3f %10.2f' % (agentName, depth, 1, seconds, 1.0)
+            for workers in workerCounts:
+                agent = agentClass(evalFn=evalFn, depth=str(depth), workers=str(workers))
+                agent.getAction(states[0])      # Starts the pool outside the timing
+                chosen = []
+                parallelSeconds = timed(lambda: chosen.extend([agent.getAction(state) for state in states]))
+                agent.pool.terminate()
+                if chosen != actions:
+                    raise Exception('%s with %d workers chose %s instead of %s' % (agentName, workers, chosen, actions))
+                parallelSeconds /= len(states)
+                print '%-16s %6d %8d %12.3f %10.2f' % (agentName, depth, workers, parallelSeconds,
+                                                       seconds / parallelSeconds)
+
+
+BENCHMARKS = {
+    'parallel': lambda options: benchmarkParallel(options.layout, options.agents, options.depths, options.workers,
+                                                  options.moves, options.evalFn),
+}
+
+
+def readCommand(argv):
+    "Processes the command used to run the benchmarks from the command line."
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python benchmark.py <benchmark> <options>
+    BENCHMARKS: %s
+    """ % ', '.join(sorted(BENCHMARKS.keys()))
+    parser = OptionParser(usageStr)
+    parser.add_option('--layout', dest='layout', default='mediumClassic',
+                      help='Layout the agents play on [Default: %default]')
+    parser.add_option('--agents', dest='agents', default='MinimaxAgent,ExpectimaxAgent',
+                      help='Comma separated agents from multiAgents.py [Default: %default]')
+    parser.add_option('--depths', dest='depths', default='3,4',
+                      help='Comma separated search depths [Default: %default]')
+    parser.add_option('--workers', dest='workers', default='4,8,16',
+                      help='Comma separated numbers of worker processes [Default: %default]')
+    parser.add_option('--moves', dest='moves', type='int', default=10,
+                      help='Number of game states searched [Default: %default]')
+    parser.add_option('--evalFn', dest='evalFn', default='better',
+                      help='Evaluation function of the agents [Default: %default]')
+    options, names = parser.parse_args(argv)
+    if len(names) != 1 or names[0] not in BENCHMARKS:
+        parser.error('Choose one benchmark from: ' + ', '.join(sorted(BENCHMARKS.keys())))
+    options.agents = options.agents.split(',')
+    options.depths = [int(depth) for depth in options.depths.split(',')]
+    options.workers = [int(workers) for workers in options.workers.split(',')]
+    return names[0], options
+
+
+if __name__ == '__main__':
+    import sys
+    name, options = readCommand(sys.argv[1:])
+    BENCHMARKS[name](options)
@@ -167,6 +167,8 @@ class Grid:
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
+    DERIVED_TABLES = ['neighborTable', 'mazeDistances']
+
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
         self.CELLS_PER_INT = 30
@@ -190,7 +192,7 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return tuple(map(tuple, self.data)) == tuple(map(tuple, other.data))
 
     def __hash__(self):
         # return hash(str(self))
@@ -203,18 +205,47 @@ class Grid:
                 base *= 2
         return hash(h)
 
-    def copy(self):
-        g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+    def __getstate__(self):
+        # Tables derived from the walls (Actions.getNeighborTable, maze
+        # distances) are cached on the grid; rebuild them rather than pickle them
+        state = self.__dict__.copy()
+        for name in Grid.DERIVED_TABLES:
+            state.pop(name, None)
+        return state
+
+    def _withData(cls, width, height, data):
+        "Returns a grid of this class holding data, without filling in a list of lists first"
+        g = cls(0, 0)
+        g.width = width
+        g.height = height
+        g.data = data
         return g
+    _withData = classmethod(_withData)
+
+    def copy(self):
+        "Returns a Grid that can be changed without changing this grid"
+        return Grid._withData(self.width, self.height, [list(x) for x in self.data])
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        return self._withData(self.width, self.height, self.data)
+
+    def readOnly(self):
+        "Returns a ReadOnlyGrid holding the contents of this grid"
+        return ReadOnlyGrid._withData(self.width, self.height, tuple(map(tuple, self.data)))
+
+    def copyWith(self, x, y, item):
+        """
+        Returns a ReadOnlyGrid copy of the grid with cell (x,y) set to item.
+        A copy of a ReadOnlyGrid shares every column but column x with it.
+        """
+        data = map(tuple, self.data)
+        column = list(data[x])
+        column[y] = item
+        data[x] = tuple(column)
+        return ReadOnlyGrid._withData(self.width, self.height, tuple(data))
 
     def count(self, item =True ):
         return sum([x.count(item) for x in self.data])
@@ -280,6 +311,132 @@ def reconstituteGrid(bitRep):
     width, height = bitRep[:2]
     return Grid(width, height, bitRepresentation= bitRep[2:])
 
+class ReadOnlyGrid(Grid):
+    """
+    A Grid that cannot be changed in place, so game states can share it with
+    each other and with agents.  Its columns are tuples; copy() returns a Grid
+    that can be changed.
+    """
+    def __setitem__(self, key, item):
+        raise Exception('The grid is read-only: change a copy() of it instead')
+
+    def readOnly(self):
+        return self
+
+class Bitboard:
+    """
+    An immutable 2-dimensional array of booleans packed into a single integer:
+    cell (x,y) is bit x * height + y.  Hashing, equality and copying cost
+    O(1) or O(words) instead of walking every cell like Grid does, which makes
+    Bitboards cheap to use inside search states.
+
+    Reading a Bitboard works like reading a Grid (board[x][y], count, asList,
+    width, height), so Grid-based code keeps working.  It cannot be modified in
+    place; clear(x, y) returns a new Bitboard instead.
+    """
+    def __init__(self, width, height, bits=0):
+        self.width = width
+        self.height = height
+        self.bits = bits
+        self._count = None
+
+    def fromGrid(grid):
+        "Packs the cells of a Grid into a Bitboard"
+        bits = 0
+        for x in range(grid.width):
+            column = grid[x]
+            for y in range(grid.height):
+                if column[y]:
+                    bits |= 1 << (x * grid.height + y)
+        return Bitboard(grid.width, grid.height, bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def toGrid(self):
+        "Returns a mutable Grid with the same cells"
+        grid = Grid(self.width, self.height)
+        for x, y in self.asList():
+            grid[x][y] = True
+        return grid
+
+    def isSet(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def clear(self, x, y):
+        "Returns a Bitboard with cell (x,y) set to False (self if it already is)"
+        bit = 1 << (x * self.height + y)
+        if not self.bits & bit:
+            return self
+        board = Bitboard(self.width, self.height, self.bits ^ bit)
+        if self._count is not None:
+            board._count = self._count - 1
+        return board
+
+    def count(self, item=True):
+        "Counts the cells equal to item, using a cached popcount"
+        if self._count is None:
+            self._count = bin(self.bits).count('1')
+        if item:
+            return self._count
+        return self.width * self.height - self._count
+
+    def iterSetBits(self):
+        "Yields the (x,y) position of every True cell, in the order Grid.asList uses"
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            index = lowest.bit_length() - 1
+            yield index // self.height, index % self.height
+            bits ^= lowest
+
+    def asList(self, key=True):
+        if key:
+            return list(self.iterSetBits())
+        return [(x, y) for x in range(self.width) for y in range(self.height) if not self.isSet(x, y)]
+
+    def __getitem__(self, x):
+        return BitboardColumn(self, x)
+
+    def __eq__(self, other):
+        if not isinstance(other, Bitboard): return False
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __str__(self):
+        return str(self.toGrid())
+
+    def copy(self):
+        return self
+
+    def deepCopy(self):
+        return self
+
+    def shallowCopy(self):
+        return self
+
+class BitboardColumn:
+    """
+    Column x of a Bitboard, so that board[x][y] reads one cell in O(1) like
+    it does for a Grid.
+    """
+    def __init__(self, board, x):
+        if x < 0: x += board.width
+        if not 0 <= x < board.width: raise IndexError('Bitboard column out of range')
+        self.height = board.height
+        self.bits = (board.bits >> (x * board.height)) & ((1 << board.height) - 1)
+
+    def __getitem__(self, y):
+        if y < 0: y += self.height
+        if not 0 <= y < self.height: raise IndexError('Bitboard row out of range')
+        return (self.bits >> y) & 1 == 1
+
+    def __len__(self):
+        return self.height
+
 ####################################
 # Parts you shouldn't have to read #
 ####################################
@@ -348,17 +505,36 @@ class Actions:
 
     getPossibleActions = staticmethod(getPossibleActions)
 
+    def getNeighborTable(walls):
+        """
+        Returns a list that maps the cell index x * walls.height + y of every
+        cell to a tuple of ((nextx, nexty), action) pairs, one for each move
+        (North, South, East, West in that order) into a free cell on the board.
+
+        The table is built once per walls Grid and kept on it.
+        """
+        table = getattr(walls, 'neighborTable', None)
+        if table is None:
+            table = []
+            moves = [(action, Actions._directions[action]) for action in
+                     [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]]
+            for x in range(walls.width):
+                for y in range(walls.height):
+                    neighbors = []
+                    for action, (dx, dy) in moves:
+                        next_x, next_y = x + dx, y + dy
+                        if 0 <= next_x < walls.width and 0 <= next_y < walls.height and not walls[next_x][next_y]:
+                            neighbors.append(((next_x, next_y), action))
+                    table.append(tuple(neighbors))
+            walls.neighborTable = table
+        return table
+    getNeighborTable = staticmethod(getNeighborTable)
+
     def getLegalNeighbors(position, walls):
         x,y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
-        neighbors = []
-        for dir, vec in Actions._directionsAsList:
-            dx, dy = vec
-            next_x = x_int + dx
-            if next_x < 0 or next_x == walls.width: continue
-            next_y = y_int + dy
-            if next_y < 0 or next_y == walls.height: continue
-            if not walls[next_x][next_y]: neighbors.append((next_x, next_y))
+        neighbors = [neighbor for neighbor, action in Actions.getNeighborTable(walls)[x_int * walls.height + y_int]]
+        if not walls[x_int][y_int]: neighbors.append((x_int, y_int))
         return neighbors
     getLegalNeighbors = staticmethod(getLegalNeighbors)
 
@@ -368,14 +544,46 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
-class GameStateData:
+_featureKeys = {}
+
+def stateFeatureKey( feature ):
     """
+    Returns the 64-bit key of a hashable state feature such as ('food', x, y).
 
+    The key is the feature's hash scrambled by the splitmix64 finalizer, so it
+    is the same in every process.  Keys are cached.
+    """
+    key = _featureKeys.get( feature )
+    if key is None:
+        mask = 0xFFFFFFFFFFFFFFFF
+        key = (hash( feature ) + 0x9E3779B97F4A7C15) & mask
+        key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & mask
+        key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & mask
+        key = _featureKeys[feature] = key ^ (key >> 31)
+    return key
+
+def agentStateKey( index, configuration, scaredTimer ):
+    "Returns the part of the state key for agent index with the given configuration and scared timer"
+    return stateFeatureKey( ('agent', index, configuration.pos, configuration.direction) ) ^ \
+           stateFeatureKey( ('scared', index, scaredTimer) )
+
+class GameStateData:
+    """
+    The food, capsules, agent states and score of a game state, plus
+    bookkeeping about the last move for the displays.
+
+    _key is a 64-bit key of the food, capsules and agent states: the XOR of the
+    stateFeatureKey of every piece of food, every capsule and every agent's
+    configuration and scared timer.  Moves keep it up to date through
+    moveAgent, setScaredTimer, removeFood and removeCapsule, so hashing and
+    comparing states does not walk the food grid.  numFood, the number of
+    pellets left, is kept up to date the same way.
     """
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
         """
+        self._key = 0
         if prevState != None:
             self.food = prevState.food.shallowCopy()
             self.capsules = prevState.capsules[:]
@@ -383,6 +591,8 @@ class GameStateData:
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._key = prevState._key
+            self.numFood = prevState.numFood
 
         self._foodEaten = None
         self._foodAdded = None
@@ -393,9 +603,20 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy( self ):
-        state = GameStateData( self )
+        """
+        Returns a copy with its own food grid.  The layout holds only the static
+        information about the board, so it is shared rather than copied.
+        """
+        state = self.shallowCopy()
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        return state
+
+    def shallowCopy( self ):
+        """
+        Returns a copy with its own agent states and capsules that shares the
+        layout and the food grid with this state.
+        """
+        state = GameStateData( self )
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -408,29 +629,60 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def computeKey( self ):
+        "Sets _key from the food, capsules and agent states"
+        key = 0
+        for x, y in self.food.asList():
+            key ^= stateFeatureKey( ('food', x, y) )
+        for position in self.capsules:
+            key ^= stateFeatureKey( ('capsule', position) )
+        for index, agentState in enumerate( self.agentStates ):
+            key ^= agentStateKey( index, agentState.configuration, agentState.scaredTimer )
+        self._key = key
+
+    def moveAgent( self, index, configuration ):
+        "Sets the configuration of an agent"
+        agentState = self.agentStates[index]
+        self._key ^= agentStateKey( index, agentState.configuration, agentState.scaredTimer ) ^ \
+                     agentStateKey( index, configuration, agentState.scaredTimer )
+        agentState.configuration = configuration
+
+    def setScaredTimer( self, index, scaredTimer ):
+        "Sets the scared timer of an agent"
+        agentState = self.agentStates[index]
+        self._key ^= agentStateKey( index, agentState.configuration, agentState.scaredTimer ) ^ \
+                     agentStateKey( index, agentState.configuration, scaredTimer )
+        agentState.scaredTimer = scaredTimer
+
+    def removeFood( self, x, y ):
+        """
+        Removes the food at (x, y).  Other states share the food grid, so this
+        state gets a copy of it that shares all but column x.
+        """
+        self.food = self.food.copyWith( x, y, False )
+        self.numFood -= 1
+        self._key ^= stateFeatureKey( ('food', x, y) )
+
+    def removeCapsule( self, position ):
+        self.capsules.remove( position )
+        self._key ^= stateFeatureKey( ('capsule', position) )
+
     def __eq__( self, other ):
         """
-        Allows two states to be compared.
+        Allows two states to be compared.  States with the same key and score
+        are taken to be equal; telling them apart would take a 64-bit collision.
         """
         if other == None: return False
-        # TODO Check for type of other
-        if not self.agentStates == other.agentStates: return False
-        if not self.food == other.food: return False
-        if not self.capsules == other.capsules: return False
-        if not self.score == other.score: return False
-        return True
+        return self._key == other._key and self.score == other.score
+
+    def __ne__( self, other ):
+        return not self == other
 
     def __hash__( self ):
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return hash( (self._key, self.score) )
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -488,7 +740,8 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = layout.food.readOnly()
+        self.numFood = self.food.count()
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
@@ -503,6 +756,7 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self.computeKey()
 
 try:
     import boinc
@@ -590,7 +844,7 @@ class Game:
                         timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            timed_func(self.state.agentCopy())
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
@@ -604,7 +858,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    agent.registerInitialState(self.state.agentCopy())
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -624,7 +878,7 @@ class Game:
                         timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(self.state.agentCopy())
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
@@ -634,10 +888,10 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(self.state.agentCopy())
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self.state.agentCopy()
 
             # Solicit an action
             action = None
@@ -683,7 +937,9 @@ class Game:
                     self.unmute()
                     return
             else:
+                start_time = time.time()
                 action = agent.getAction(observation)
+                self.totalAgentTimes[agentIndex] += time.time() - start_time
             self.unmute()
 
             # Execute the action
@@ -0,0 +1,296 @@
+# gameRecords.py
+# --------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Compact recordings of Pacman games, kept in append-only game archives.
+
+An archive is a file that starts with ARCHIVE_MAGIC and is followed by
+records, each of which is a RECORD header (kind, layout hash, length of the
+payload) and its payload:
+
+  'L' records hold the text of a layout, written once per archive and named
+      by the SHA-1 hash of that text.
+  'G' records hold a game on the layout with their hash: a GAME header with
+      its index, random seed and outcome (including whether its last action
+      raised an exception and was never made), then its actions packed as 3-bit
+      codes, eight to every three bytes.  Agents move in turn starting with
+      Pacman, so the agent of each action is not stored.
+  'S' records may follow a 'G' record with snapshots of its game: a
+      SNAPSHOTS header with the offset of the 'G' record in the archive, the
+      number of moves between snapshots and their number, then each snapshot
+      (see takeSnapshot) after its length.  Replays start from the last
+      snapshot before the move they seek to.
+
+A record cut short by a crash while it was written ends the archive: it is
+ignored when the archive is read and written over by the next append.
+"""
+
+from game import Directions, Configuration, Grid
+import hashlib
+import layout
+import struct
+import time
+
+ARCHIVE_MAGIC = 'PACGAMES3\n'
+RECORD = struct.Struct('<c20sI')
+GAME = struct.Struct('<Iqdd????BI')
+SNAPSHOTS = struct.Struct('<QII')
+SNAPSHOT_ROUNDS = 100
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS))
+
+def layoutHash(layoutText):
+    "Returns the 20 byte content hash that names the text of a layout in an archive"
+    return hashlib.sha1('\n'.join(layoutText)).digest()
+
+def packActions(actions):
+    "Packs a list of actions into a string of 3-bit codes"
+    packed = bytearray()
+    for start in range(0, len(actions), 8):
+        bits = 0
+        for shift, action in enumerate(actions[start:start + 8]):
+            if action not in ACTION_CODES:
+                raise Exception('Cannot record the action %s' % str(action))
+            bits |= ACTION_CODES[action] << (3 * shift)
+        packed.extend(struct.pack('<I', bits)[:3])
+    return str(packed)
+
+def unpackActions(packed, numActions):
+    "Returns the first numActions actions of a string made by packActions"
+    actions = []
+    for start in range(0, len(packed), 3):
+        bits = struct.unpack('<I', packed[start:start + 3] + '\0')[0]
+        for shift in range(min(8, numActions - len(actions))):
+            actions.append(ACTIONS[(bits >> (3 * shift)) & 7])
+    return actions
+
+def takeSnapshot(data):
+    """
+    Returns a string holding the score, agent configurations and scared
+    timers, capsules and food of the GameStateData data, which restoreSnapshot
+    puts back into a state of the same game.
+    """
+    parts = [struct.pack('<d', data.score)]
+    for agentState in data.agentStates:
+        x, y = agentState.configuration.getPosition()
+        direction = ACTION_CODES[agentState.configuration.getDirection()]
+        parts.append(struct.pack('<ddBH', x, y, direction, agentState.scaredTimer))
+    parts.append(struct.pack('<H', len(data.capsules)))
+    for x, y in data.capsules:
+        parts.append(struct.pack('<HH', x, y))
+    food = bytearray((data.food.width * data.food.height + 7) / 8)
+    for x, y in data.food.asList():
+        cell = x * data.food.height + y
+        food[cell / 8] |= 1 << (cell % 8)
+    parts.append(str(food))
+    return ''.join(parts)
+
+def restoreSnapshot(data, snapshot):
+    "Sets the GameStateData data, a state of the game of the snapshot, to the state in the snapshot"
+    data.score = struct.unpack_from('<d', snapshot)[0]
+    offset = 8
+    for agentState in data.agentStates:
+        x, y, direction, scaredTimer = struct.unpack_from('<ddBH', snapshot, offset)
+        offset += 19
+        agentState.configuration = Configuration((x, y), ACTIONS[direction])
+        agentState.scaredTimer = scaredTimer
+    numCapsules = struct.unpack_from('<H', snapshot, offset)[0]
+    offset += 2
+    data.capsules = []
+    for i in range(numCapsules):
+        data.capsules.append(struct.unpack_from('<HH', snapshot, offset))
+        offset += 4
+    width, height = data.food.width, data.food.height
+    food = bytearray(snapshot[offset:])
+    grid = Grid(width, height)
+    for cell in range(width * height):
+        if food[cell / 8] & (1 << (cell % 8)):
+            grid[cell / height][cell % height] = True
+    data.food = grid.readOnly()
+    data.numFood = data.food.count()
+    data.computeKey()
+
+class GameRecord:
+    """
+    A recorded game: the text of its layout, the number of agents that
+    played, their actions in the order they were chosen and what is known of
+    how the game started (seed is None when it was not drawn for the game)
+    and ended.  lastMoveFailed is True when the last action raised an
+    exception, which crashed the game, so it was never made.  snapshots[k]
+    is a snapshot of the state after (k + 1) * snapshotInterval moves.
+    """
+    def __init__(self, layoutText, numAgents, actions, index=0, seed=None, score=0, win=False,
+                 crashed=False, timedOut=False, recordTime=None, snapshotInterval=0, snapshots=(),
+                 lastMoveFailed=False):
+        self.layoutText = layoutText
+        self.numAgents = numAgents
+        self.actions = actions
+        self.index = index
+        self.seed = seed
+        self.score = score
+        self.win = win
+        self.crashed = crashed
+        self.timedOut = timedOut
+        if recordTime is None:
+            recordTime = time.time()
+        self.recordTime = recordTime
+        self.snapshotInterval = snapshotInterval
+        self.snapshots = list(snapshots)
+        self.lastMoveFailed = lastMoveFailed
+
+    def fromGame(gameLayout, game, index, seed=None, snapshotRounds=SNAPSHOT_ROUNDS):
+        """
+        Records a game that was played on gameLayout as game number index,
+        with a snapshot every snapshotRounds rounds of moves (none if it is
+        0).  The game is replayed from the initial state of its rules to take
+        the snapshots and, if it crashed, to find out whether its last action
+        was the one that raised.
+        """
+        actions = [action for agentIndex, action in game.moveHistory]
+        record = GameRecord(gameLayout.layoutText, len(game.agents), actions, index, seed, game.state.getScore(),
+                            game.state.isWin(), game.agentCrashed, game.agentTimeout)
+        if snapshotRounds > 0:
+            record.snapshotInterval = snapshotRounds * record.numAgents
+        if snapshotRounds > 0 or game.agentCrashed:
+            state = game.rules.initialState
+            lastMove = len(game.moveHistory) - 1
+            for move, (agentIndex, action) in enumerate(game.moveHistory):
+                try:
+                    state = state.generateSuccessor(agentIndex, action)
+                except Exception:
+                    if not game.agentCrashed or move < lastMove:
+                        raise
+                    record.lastMoveFailed = True
+                    break
+                if snapshotRounds > 0 and (move + 1) % record.snapshotInterval == 0:
+                    record.snapshots.append(takeSnapshot(state.data))
+        return record
+    fromGame = staticmethod(fromGame)
+
+    def getLayout(self):
+        return layout.Layout(self.layoutText)
+
+    def getMoveHistory(self):
+        "Returns the (agentIndex, action) pairs of the game, like Game.moveHistory"
+        return [(i % self.numAgents, action) for i, action in enumerate(self.actions)]
+
+    def getMoves(self):
+        "Returns the (agentIndex, action) pairs of the moves that were made: all but a last action that failed"
+        moves = self.getMoveHistory()
+        if self.lastMoveFailed:
+            moves.pop()
+        return moves
+
+class GameArchive:
+    """
+    An append-only file of GameRecords (see the module docstring for its
+    format).  Opening an archive reads only its record headers and layouts;
+    games are read when they are indexed.
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self.file = open(fname, 'a+b')
+        self.layouts = {}
+        self.gameOffsets = []
+        self.snapshotOffsets = {}
+        self.file.seek(0, 2)
+        if self.file.tell() == 0:
+            self.file.write(ARCHIVE_MAGIC)
+            self.file.flush()
+        self.file.seek(0)
+        if self.file.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            self.file.close()
+            raise Exception('%s is not a game archive' % fname)
+        self.file.seek(0, 2)
+        size = self.file.tell()
+        offset = len(ARCHIVE_MAGIC)
+        self.file.seek(offset)
+        header = self.file.read(RECORD.size)
+        while len(header) == RECORD.size:
+            kind, key, length = RECORD.unpack(header)
+            if offset + RECORD.size + length > size:    # Cut short
+                break
+            if kind == 'L':
+                self.layouts[key] = self.file.read(length).split('\n')
+            elif kind == 'S' and length >= SNAPSHOTS.size:
+                gameOffset = SNAPSHOTS.unpack(self.file.read(SNAPSHOTS.size))[0]
+                if self.gameOffsets and self.gameOffsets[-1] == gameOffset:
+                    self.snapshotOffsets[len(self.gameOffsets) - 1] = offset
+                self.file.seek(length - SNAPSHOTS.size, 1)
+            else:
+                if kind == 'G':
+                    self.gameOffsets.append(offset)
+                self.file.seek(length, 1)
+            offset += RECORD.size + length
+            header = self.file.read(RECORD.size)
+        self.end = offset   # The end of the last complete record
+
+    def append(self, record):
+        "Writes a GameRecord, and its layout if the archive does not have it yet, to the end of the archive"
+        self.file.seek(0, 2)
+        if self.file.tell() > self.end:     # Drop a record that was cut short
+            self.file.truncate(self.end)
+            self.file.seek(0, 2)
+        key = layoutHash(record.layoutText)
+        if key not in self.layouts:
+            text = '\n'.join(record.layoutText)
+            self.file.write(RECORD.pack('L', key, len(text)) + text)
+            self.layouts[key] = list(record.layoutText)
+        seed = record.seed
+        if seed is None:
+            seed = -1
+        payload = GAME.pack(record.index, seed, record.recordTime, record.score, record.win, record.crashed,
+                            record.timedOut, record.lastMoveFailed, record.numAgents, len(record.actions)) + \
+                  packActions(record.actions)
+        gameOffset = self.file.tell()
+        self.gameOffsets.append(gameOffset)
+        self.file.write(RECORD.pack('G', key, len(payload)) + payload)
+        if record.snapshots:
+            self.snapshotOffsets[len(self.gameOffsets) - 1] = self.file.tell()
+            payload = SNAPSHOTS.pack(gameOffset, record.snapshotInterval, len(record.snapshots)) + \
+                      ''.join([struct.pack('<I', len(snapshot)) + snapshot for snapshot in record.snapshots])
+            self.file.write(RECORD.pack('S', key, len(payload)) + payload)
+        self.file.flush()
+        self.end = self.file.tell()
+
+    def __len__(self):
+        return len(self.gameOffsets)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        self.file.seek(self.gameOffsets[i])
+        kind, key, length = RECORD.unpack(self.file.read(RECORD.size))
+        payload = self.file.read(length)
+        index, seed, recordTime, score, win, crashed, timedOut, lastMoveFailed, numAgents, numActions = \
+            GAME.unpack(payload[:GAME.size])
+        if seed == -1:
+            seed = None
+        record = GameRecord(self.layouts[key], numAgents, unpackActions(payload[GAME.size:], numActions), index, seed,
+                            score, win, crashed, timedOut, recordTime, lastMoveFailed=lastMoveFailed)
+        if i in self.snapshotOffsets:
+            self.file.seek(self.snapshotOffsets[i] + RECORD.size)
+            gameOffset, record.snapshotInterval, numSnapshots = SNAPSHOTS.unpack(self.file.read(SNAPSHOTS.size))
+            for k in range(numSnapshots):
+                length = struct.unpack('<I', self.file.read(4))[0]
+                record.snapshots.append(self.file.read(length))
+        return record
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self.file.close()
@@ -12,11 +12,14 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
-from util import manhattanDistance
-from game import Directions
-import random, util
+from util import manhattanDistance, nearestPoint
+from game import Directions, Actions, AgentState, Configuration
+from game import stateFeatureKey, agentStateKey
+import random, sys, time, util
+import multiprocessing
 
 from game import Agent
+import gameRecords
 
 class ReflexAgent(Agent):
     """
@@ -92,6 +95,409 @@ def scoreEvaluationFunction(currentGameState):
     """
     return currentGameState.getScore()
 
+class SearchState(object):
+    """
+    A slim GameState for game-tree search, with the same accessor methods.
+
+    The layout, the walls and the agents' start configurations are shared by
+    every SearchState of a game.  A successor copies only what its action
+    changes: the tuple of (configuration, scaredTimer) agent entries, the
+    eaten pellet's column of the food grid (see Grid.copyWith) or the capsule
+    tuple.  It keeps no bookkeeping for the displays and is not recorded by
+    ExploredStates.  Like GameStateData it keeps a 64-bit key of its food,
+    capsules and agents, which is the same as the GameStateData key of the
+    same state.
+
+    Convert with SearchState.fromGameState(gameState) and toGameState().  A
+    SearchState follows the rules of the module that defines the GameState it
+    was made from: pacman, or __main__ when pacman.py is run as a script.
+    getPacmanState, getGhostState(s) and getFood return objects shared with
+    or built for the caller, which must not change them.
+    """
+    __slots__ = ('rules', 'layout', 'starts', 'food', 'numFood', 'capsules', 'agents', 'score', 'key', '_win', '_lose',
+                 '_legalActions')
+
+    def fromGameState(gameState):
+        data = gameState.data
+        state = SearchState()
+        state.rules = sys.modules[gameState.__class__.__module__]
+        state.layout = data.layout
+        state.starts = tuple([agentState.start for agentState in data.agentStates])
+        state.food = data.food
+        state.numFood = data.numFood
+        state.capsules = tuple(data.capsules)
+        state.agents = tuple([(agentState.configuration, agentState.scaredTimer) for agentState in data.agentStates])
+        state.score = data.score
+        state.key = data._key
+        state._win = data._win
+        state._lose = data._lose
+        return state
+    fromGameState = staticmethod(fromGameState)
+
+    def toGameState(self):
+        "Returns a GameState with the same layout, food, capsules, agents and score"
+        state = self.rules.GameState()
+        data = state.data
+        data.layout = self.layout
+        data.food = self.food.shallowCopy()
+        data.numFood = self.numFood
+        data.capsules = list(self.capsules)
+        data.agentStates = [self.getAgentState(index) for index in range(len(self.agents))]
+        data._eaten = [False for agent in self.agents]
+        data.score = self.score
+        data._key = self.key
+        data._win = self._win
+        data._lose = self._lose
+        return state
+
+    def __init__(self):
+        self._legalActions = {}
+
+    def getLegalActions(self, agentIndex=0):
+        actions = self._legalActions.get(agentIndex)
+        if actions is None:
+            if self._win or self._lose:
+                actions = ()
+            else:
+                conf = self.agents[agentIndex][0]
+                actions = Actions.getPossibleActions(conf, self.layout.walls)
+                if agentIndex > 0:  # As GhostRules.getLegalActions
+                    reverse = Actions.reverseDirection(conf.direction)
+                    if Directions.STOP in actions:
+                        actions.remove(Directions.STOP)
+                    if reverse in actions and len(actions) > 1:
+                        actions.remove(reverse)
+                actions = tuple(actions)
+            self._legalActions[agentIndex] = actions
+        return list(actions)
+
+    def generateSuccessor(self, agentIndex, action):
+        """
+        Returns the successor state after the specified agent takes the
+        action, following the same rules as GameState.generateSuccessor.
+        """
+        if self._win or self._lose: raise Exception('Can\'t generate a successor of a terminal state.')
+        if action not in self.getLegalActions(agentIndex):
+            raise Exception("Illegal action " + str(action))
+
+        rules = self.rules
+        state = SearchState()
+        state.rules = rules
+        state.layout = self.layout
+        state.starts = self.starts
+        state.food = self.food
+        state.numFood = self.numFood
+        state.capsules = self.capsules
+        state._win = False
+        state._lose = False
+        agents = list(self.agents)
+        scoreChange = 0
+        key = self.key
+
+        conf, scaredTimer = agents[agentIndex]
+        if agentIndex == 0:  # Pacman is moving
+            conf = conf.generateSuccessor(Actions.directionToVector(action, rules.PacmanRules.PACMAN_SPEED))
+            agents[0] = (conf, scaredTimer)
+            position = nearestPoint(conf.pos)
+            if manhattanDistance(position, conf.pos) <= 0.5:
+                x, y = position
+                if state.food[x][y]:
+                    scoreChange += 10
+                    state.food = state.food.copyWith(x, y, False)
+                    state.numFood -= 1
+                    key ^= stateFeatureKey(('food', x, y))
+                    if state.numFood == 0:
+                        scoreChange += 500
+                        state._win = True
+                if position in state.capsules:
+                    state.capsules = tuple([capsule for capsule in state.capsules if capsule != position])
+                    key ^= stateFeatureKey(('capsule', position))
+                    for index in range(1, len(agents)):
+                        agents[index] = (agents[index][0], rules.SCARED_TIME)
+            scoreChange -= rules.TIME_PENALTY
+            ghosts = range(1, len(agents))
+        else:                # A ghost is moving
+            speed = rules.GhostRules.GHOST_SPEED
+            if scaredTimer > 0: speed /= 2.0
+            conf = conf.generateSuccessor(Actions.directionToVector(action, speed))
+            if scaredTimer == 1:
+                conf = Configuration(nearestPoint(conf.pos), conf.direction)
+            agents[agentIndex] = (conf, max(0, scaredTimer - 1))
+            ghosts = [agentIndex]
+
+        # Collisions, as GhostRules.checkDeath
+        pacmanPosition = agents[0][0].pos
+        for index in ghosts:
+            conf, scaredTimer = agents[index]
+            if rules.GhostRules.canKill(pacmanPosition, conf.pos):
+                if scaredTimer > 0:
+                    scoreChange += 200
+                    agents[index] = (self.starts[index], 0)
+                elif not state._win:
+                    scoreChange -= 500
+                    state._lose = True
+
+        for index, agent in enumerate(agents):
+            if agent != self.agents[index]:
+                key ^= agentStateKey(index, *self.agents[index]) ^ agentStateKey(index, *agent)
+        state.agents = tuple(agents)
+        state.score = self.score + scoreChange
+        state.key = key
+        return state
+
+    def getLegalPacmanActions(self):
+        return self.getLegalActions(0)
+
+    def generatePacmanSuccessor(self, action):
+        return self.generateSuccessor(0, action)
+
+    def getAgentState(self, agentIndex):
+        "Returns a new AgentState for the agent"
+        conf, scaredTimer = self.agents[agentIndex]
+        agentState = AgentState(self.starts[agentIndex], agentIndex == 0)
+        agentState.configuration = conf
+        agentState.scaredTimer = scaredTimer
+        return agentState
+
+    def getPacmanState(self):
+        return self.getAgentState(0)
+
+    def getPacmanPosition(self):
+        return self.agents[0][0].pos
+
+    def getGhostStates(self):
+        return [self.getAgentState(index) for index in range(1, len(self.agents))]
+
+    def getGhostState(self, agentIndex):
+        if agentIndex == 0 or agentIndex >= self.getNumAgents():
+            raise Exception("Invalid index passed to getGhostState")
+        return self.getAgentState(agentIndex)
+
+    def getGhostPosition(self, agentIndex):
+        if agentIndex == 0:
+            raise Exception("Pacman's index passed to getGhostPosition")
+        return self.agents[agentIndex][0].pos
+
+    def getGhostPositions(self):
+        return [conf.pos for conf, scaredTimer in self.agents[1:]]
+
+    def getNumAgents(self):
+        return len(self.agents)
+
+    def getScore(self):
+        return float(self.score)
+
+    def getCapsules(self):
+        return list(self.capsules)
+
+    def getNumFood(self):
+        return self.numFood
+
+    def getFood(self):
+        return self.food
+
+    def getWalls(self):
+        return self.layout.walls
+
+    def hasFood(self, x, y):
+        return self.food[x][y]
+
+    def hasWall(self, x, y):
+        return self.layout.walls[x][y]
+
+    def isLose(self):
+        return self._lose
+
+    def isWin(self):
+        return self._win
+
+    def __eq__(self, other):
+        return isinstance(other, SearchState) and self.key == other.key and self.score == other.score
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.key, self.score))
+
+    def __str__(self):
+        return str(self.toGameState())
+
+# Bound types of transposition table values
+EXACT, LOWER, UPPER = 0, 1, 2   # value is the node value, a lower bound on it or an upper bound on it
+
+class TranspositionTable:
+    """
+      A bounded cache of search results for game states reached by different
+      move orders.  Entries are keyed by the state, the number of plies left to
+      search below it and the agent to move, and store the value found, its
+      bound type (EXACT, LOWER or UPPER; only alpha-beta stores bounds) and the
+      action that achieved it.
+
+      The table has a fixed number of slots and each key maps to one slot.  A
+      new entry replaces the one already in its slot if that entry was stored
+      during an earlier getAction call or searched no deeper (depth-preferred
+      replacement).  Values are only reused within the same state, depth and
+      agent, so the evaluation function must depend on the state alone.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.slots = [None] * size
+        self.generation = 0     # Number of the current search
+        self.probes = 0         # Lookups and hits during the current search
+        self.hits = 0
+
+    def newSearch(self):
+        "Starts the counters of a new getAction call; older entries become replaceable"
+        self.generation += 1
+        self.probes = 0
+        self.hits = 0
+
+    def lookup(self, state, depth, agent):
+        "Returns the (value, bound, action) stored for the key, or None"
+        self.probes += 1
+        key = (state, depth, agent)
+        entry = self.slots[hash(key) % self.size]
+        if entry is None or entry[0] != key:
+            return None
+        self.hits += 1
+        return entry[2:]
+
+    def store(self, state, depth, agent, value, bound, action):
+        key = (state, depth, agent)
+        slot = hash(key) % self.size
+        entry = self.slots[slot]
+        if entry is None or entry[1] != self.generation or entry[0][1] <= depth:
+            self.slots[slot] = (key, self.generation, value, bound, action)
+
+    def hitRate(self):
+        "Returns the fraction of lookups of the current search that found an entry"
+        return float(self.hits) / max(1, self.probes)
+
+class SearchTimeout(Exception):
+    "Raised inside an anytime search when the time budget of the move has run out"
+    pass
+
+def principalFirst(actions, pv):
+    "Returns actions with the first move of the principal variation pv, if legal, moved to the front"
+    if pv and pv[0] in actions:
+        actions = [pv[0]] + [act for act in actions if act != pv[0]]
+    return actions
+
+class MoveOrdering:
+    """
+      Chooses the order in which alpha-beta tries the moves of a node, so that
+      good moves come first and more of the others are pruned.  Pacman nodes
+      and ghost nodes each rank their moves by a list of heuristics, the first
+      heuristic deciding and later ones breaking its ties:
+
+        'killer'   moves that caused a cutoff at the same ply earlier in this
+                   getAction call (the last two such moves of each ply)
+        'history'  moves that caused cutoffs for the same agent earlier in this
+                   getAction call, weighted by the square of the plies below
+        'eval'     moves whose successor the evaluation function rates best for
+                   the agent to move (generates every successor up front)
+
+      The first move of the principal variation, when given, always comes first.
+      With no heuristics moves are tried in getLegalActions order, which expands
+      exactly the nodes of plain alpha-beta.
+    """
+
+    HEURISTICS = ['killer', 'history', 'eval']
+
+    def __init__(self, pacmanHeuristics, ghostHeuristics, evaluationFunction):
+        for name in pacmanHeuristics + ghostHeuristics:
+            if name not in self.HEURISTICS:
+                raise Exception('Unknown move ordering heuristic: %s (use %s)' % (name, ', '.join(self.HEURISTICS)))
+        self.heuristics = (pacmanHeuristics, ghostHeuristics)
+        self.evaluationFunction = evaluationFunction
+        self.newSearch()
+
+    def newSearch(self):
+        "Forgets the killer moves and history scores of the previous getAction call"
+        self.killers = {}               # ply -> the last two moves that caused a cutoff there
+        self.history = util.Counter()   # (agent, action) -> cutoff score
+
+    def children(self, state, agent, actions, ply, pv):
+        """
+          Returns the (action, successor) pairs of the node, whose legal actions
+          are given, in the order to try them.  The successor is None where it
+          has not been generated yet.
+        """
+        heuristics = self.heuristics[agent > 0]
+        if not heuristics:
+            return [(act, None) for act in principalFirst(actions, pv)]
+
+        successors = [None] * len(actions)
+        if 'eval' in heuristics:
+            sign = agent and -1 or 1    # Ghosts prefer low evaluations
+            successors = [state.generateSuccessor(agent, act) for act in actions]
+            values = [sign * self.evaluationFunction(successor) for successor in successors]
+        killers = self.killers.get(ply, ())
+        pvMove = pv and pv[0]
+
+        def rank(i):
+            act = actions[i]
+            key = [act == pvMove]
+            for name in heuristics:
+                if name == 'killer':
+                    key.append(act in killers and 2 - killers.index(act))
+                elif name == 'history':
+                    key.append(self.history[(agent, act)])
+                else:
+                    key.append(values[i])
+            return key
+
+        order = sorted(range(len(actions)), key=rank, reverse=True)    # Stable: ties keep their legal order
+        return [(actions[i], successors[i]) for i in order]
+
+    def cutoff(self, agent, ply, remaining, act):
+        "Records that act caused a cutoff at the given ply with remaining plies searched below it"
+        if not self.heuristics[agent > 0]:
+            return
+        killers = self.killers.get(ply, ())
+        self.killers[ply] = ((act,) + tuple([killer for killer in killers if killer != act]))[:2]
+        self.history[(agent, act)] += remaining * remaining
+
+# State of a worker process of MultiAgentSearchAgent.workerPool
+_worker = {}
+
+def _startWorker(agentClass, agentArgs, layout, stateClass):
+    """
+      Sets up a worker process with its own copy of the searching agent and
+      the layout.  stateClass is the GameState class of the game, which is
+      passed in rather than imported because pacman.py may be running as
+      __main__.
+    """
+    _worker['agent'] = agentClass(**agentArgs)
+    _worker['layout'] = layout
+    _worker['stateClass'] = stateClass
+    _worker['snapshot'] = None
+
+def _searchSubtree(task):
+    """
+      Returns the value the worker's agent gives the state reached from the
+      root state, sent as a snapshot (see gameRecords.takeSnapshot), by a
+      Pacman move and a first ghost move, and the transposition table
+      (probes, hits) of that search
+    """
+    snapshot, numAgents, action, ghostAction, depth, agent = task
+    searcher = _worker['agent']
+    if snapshot != _worker['snapshot']:     # First subtree of a new move
+        state = _worker['stateClass']()
+        state.initialize(_worker['layout'], numAgents - 1)
+        gameRecords.restoreSnapshot(state.data, snapshot)
+        _worker['snapshot'], _worker['state'] = snapshot, state
+        searcher.startSearch()
+    table = searcher.transpositionTable
+    probes, hits = table and (table.probes, table.hits) or (0, 0)
+    successor = _worker['state'].generateSuccessor(0, action).generateSuccessor(1, ghostAction)
+    value = searcher.searchNode(searcher.searchRoot(successor), depth, agent)[1]
+    if table:
+        probes, hits = table.probes - probes, table.hits - hits
+    return value, probes, hits
+
 class MultiAgentSearchAgent(Agent):
     """
       This class provides some common elements to all of your
@@ -105,18 +511,222 @@ class MultiAgentSearchAgent(Agent):
       Note: this is an abstract class: one that should not be instantiated.  It's
       only partially specified, and designed to be extended.  Agent (game.py)
       is another abstract class.
+
+      Setting transpositionTableSize (for example -a transpositionTableSize=65536)
+      makes the minimax, alpha-beta and expectimax agents cache the values of the
+      states they search in a TranspositionTable of that many slots.  Decisions
+      are unchanged but fewer states are expanded, so it is off by default.  The
+      (probes, hits) of each getAction call of the current game are kept in
+      transpositionStats.
+
+      Setting timeBudget (for example -a timeBudget=0.5) puts the minimax,
+      alpha-beta and expectimax agents in anytime mode: instead of searching
+      self.depth plies they search 1, 2, 3... plies until timeBudget seconds
+      have passed and play the move of the deepest search that finished.  The
+      depth reached on each move of the current game is kept in depthStats.
+
+      Setting pacmanOrdering and ghostOrdering to '+'-separated lists of
+      MoveOrdering heuristics (for example -a pacmanOrdering=eval+history)
+      changes the order in which the alpha-beta agent tries moves.  Setting
+      orderingBaseline (-a orderingBaseline) also searches every move again
+      with plain alpha-beta, without ordering or transposition table, and keeps
+      the (nodes, baseline nodes) of each getAction call in orderingStats.
+      Both counts leave out an anytime search that ran out of time.
+
+      An agent raises an exception when it is given one of these options that
+      it does not use (see unsupportedOptions).
+
+      Setting workers (for example -a workers=4) makes the minimax and
+      expectimax agents search the subtrees below each pair of a Pacman move
+      and a first ghost move in a pool of that many processes.  The workers
+      live as long as the agent and keep their own copy of the layout, so only
+      a snapshot of the state is sent for each move.  The decisions are the
+      same as with one process, and the transposition table statistics are
+      those of the workers' tables.  The workers search self.depth plies, so workers cannot
+      be combined with timeBudget.
+
+      Setting slimStates (-a slimStates) makes the agents search SearchStates
+      (pacman.py) instead of GameStates: the root GameState is converted once
+      and every state below it is a SearchState, which is much cheaper to
+      generate.  The evaluation function is then given SearchStates.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    unsupportedOptions = ()     # Names of the options above that the agent ignores
+
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', transpositionTableSize = '0', timeBudget = '0',
+                 pacmanOrdering = '', ghostOrdering = '', orderingBaseline = '0', workers = '0', slimStates = '0'):
+        options = dict(timeBudget=timeBudget, pacmanOrdering=pacmanOrdering, ghostOrdering=ghostOrdering,
+                       orderingBaseline=orderingBaseline, workers=workers)
+        for name in self.unsupportedOptions:
+            if options[name] not in ('', '0', 0):
+                raise Exception('%s does not support the %s option' % (self.__class__.__name__, name))
+        self.searchArgs = dict(evalFn=evalFn, depth=depth, transpositionTableSize=transpositionTableSize,
+                               slimStates=slimStates)
         self.index = 0 # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        self.transpositionTable = None
+        if int(transpositionTableSize) > 0:
+            self.transpositionTable = TranspositionTable(int(transpositionTableSize))
+        self.transpositionStats = []
+        self.timeBudget = float(timeBudget)
+        self.searchDepth = self.depth   # Plies searched by the current search
+        self.deadline = None            # Time at which an anytime search gives up, if any
+        self.cutoff = False             # Whether the current search stopped anywhere at searchDepth
+        self.depthStats = []
+        self.ordering = MoveOrdering(pacmanOrdering.split('+') if pacmanOrdering else [],
+                                     ghostOrdering.split('+') if ghostOrdering else [],
+                                     self.evaluationFunction)
+        self.orderingBaseline = int(orderingBaseline)
+        self.orderingStats = []
+        self.nodes = 0                  # Nodes visited by the finished searches of the current move
+        self.workers = int(workers)
+        if self.workers > 0 and self.timeBudget > 0:
+            raise Exception('workers and timeBudget cannot be used together')
+        self.pool = None
+        self.poolLayout = None          # Text of the layout the workers hold
+        self.slimStates = int(slimStates)
+
+    def searchRoot(self, gameState):
+        "Returns the state to search from: gameState, or a SearchState of it with slimStates"
+        if self.slimStates:
+            return SearchState.fromGameState(gameState)
+        return gameState
+
+    def workerPool(self, gameState):
+        "Returns the pool of worker processes for the game of gameState, started anew when the layout changes"
+        layout = gameState.data.layout
+        if self.pool is None or self.poolLayout != layout.layoutText:
+            if self.pool is not None:
+                self.pool.terminate()
+            self.pool = multiprocessing.Pool(self.workers, _startWorker,
+                                             (self.__class__, self.searchArgs, layout, gameState.__class__))
+            self.poolLayout = layout.layoutText
+        return self.pool
+
+    def splitRootAction(self, gameState):
+        """
+          Returns the action searchNode(gameState) chooses, with the subtree
+          below each pair of a Pacman move and a first ghost move searched by
+          the worker pool.  The values of the first ghost's moves are combined
+          by ghostValue and Pacman takes the first move of highest value, as
+          the sequential search does.
+        """
+        pool = self.workerPool(gameState)
+        if gameState.getNumAgents() == 2:   # The first ghost ends the round
+            depth, agent = 1, 0
+        else:
+            depth, agent = 0, 2
+
+        # The workers hold the layout, so only the parts of the state that change are sent
+        snapshot = gameRecords.takeSnapshot(gameState.data)
+        numAgents = gameState.getNumAgents()
+
+        tasks, nodes = [], []
+        for action in gameState.getLegalActions(0):
+            successor = gameState.generateSuccessor(0, action)
+            ghostActions = successor.getLegalActions(1)
+            if self.depth == 0 or not ghostActions:     # Leaf node
+                nodes.append((action, self.evaluationFunction(successor), 0))
+            else:
+                nodes.append((action, None, len(ghostActions)))
+                tasks.extend([(snapshot, numAgents, action, ghostAction, depth, agent) for ghostAction in ghostActions])
+        results = pool.map(_searchSubtree, tasks, 1)
+        values = [result[0] for result in results]
+        if self.transpositionTable:
+            self.transpositionTable.probes += sum([result[1] for result in results])
+            self.transpositionTable.hits += sum([result[2] for result in results])
+
+        value = float("-inf")
+        for act, newValue, numGhostActions in nodes:
+            if newValue is None:
+                newValue = self.ghostValue(values[:numGhostActions])
+                values = values[numGhostActions:]
+            if newValue > value:
+                value = newValue
+                action = act
+        return action
+
+    def ghostValue(self, values):
+        "Returns the value of a first ghost node from the values of its moves, in legal order"
+        util.raiseNotDefined()
+
+    def deepen(self, search):
+        """
+          Returns search(None) run at self.depth plies or, in anytime mode, the
+          result of the deepest of search(None), search(result at 1 ply), ...
+          run at 1, 2, ... plies that finished within the time budget.  Each
+          search gets the result of the one before, so it can be used to order
+          moves.  The 1-ply search always runs to the end.
+        """
+        if self.timeBudget <= 0:
+            self.searchDepth = self.depth
+            return search(None)
+
+        start = time.time()
+        result = None
+        nodes = self.nodes
+        self.searchDepth = 0
+        try:
+            while True:
+                self.searchDepth += 1
+                self.cutoff = False
+                result = search(result)
+                nodes = self.nodes
+                if not self.cutoff:     # Every line ended in a win or loss: searching deeper changes nothing
+                    break
+                self.deadline = start + self.timeBudget
+        except SearchTimeout:
+            self.searchDepth -= 1
+            self.nodes = nodes          # The orderingBaseline search cannot repeat a search that ran out of time
+        self.deadline = None
+        self.depthStats.append(self.searchDepth)
+        return result
+
+    def startSearch(self):
+        "Called at the start of getAction"
+        if self.transpositionTable:
+            self.transpositionTable.newSearch()
+        self.ordering.newSearch()
+        self.nodes = 0
+
+    def finishSearch(self):
+        "Called at the end of getAction"
+        if self.transpositionTable:
+            self.transpositionStats.append((self.transpositionTable.probes, self.transpositionTable.hits))
+
+    def final(self, state):
+        "Prints the search statistics of the game that just ended and stops the worker pool"
+        if self.transpositionStats:
+            probes = sum([stats[0] for stats in self.transpositionStats])
+            hits = sum([stats[1] for stats in self.transpositionStats])
+            print 'Transposition table: %d hits in %d lookups (%.1f%%) over %d moves' % \
+                (hits, probes, 100.0 * hits / max(1, probes), len(self.transpositionStats))
+            self.transpositionStats = []
+        if self.depthStats:
+            print 'Anytime search: average depth %.1f (%d to %d) over %d moves' % \
+                (float(sum(self.depthStats)) / len(self.depthStats), min(self.depthStats),
+                 max(self.depthStats), len(self.depthStats))
+            self.depthStats = []
+        if self.orderingStats:
+            nodes = sum([stats[0] for stats in self.orderingStats])
+            baseline = sum([stats[1] for stats in self.orderingStats])
+            print 'Move ordering: %d nodes against %d unordered (%.1f%%) over %d moves' % \
+                (nodes, baseline, 100.0 * nodes / max(1, baseline), len(self.orderingStats))
+            self.orderingStats = []
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self.poolLayout = None
 
 class MinimaxAgent(MultiAgentSearchAgent):
     """
       Your minimax agent (question 2)
     """
 
+    unsupportedOptions = ('pacmanOrdering', 'ghostOrdering', 'orderingBaseline')
+
     def getAction(self, gameState):
         """
           Returns the minimax action from the current gameState using self.depth
@@ -134,8 +744,22 @@ class MinimaxAgent(MultiAgentSearchAgent):
           gameState.getNumAgents():
             Returns the total number of agents in the game
         """
+        self.startSearch()
+        if self.workers:
+            action = self.splitRootAction(gameState)
+        else:
+            root = self.searchRoot(gameState)
+            action = self.deepen(lambda previous: self.searchNode(root)[0])
+        self.finishSearch()
+        return action
+
+    def searchNode(self, state, depth=0, agent=0):
+        """
+          Returns the (action, value) of the minimax tree below state, where
+          agent moves next and depth rounds of moves have been played
+        """
 
-        def minValue(state, depth, agent):      # Calculates min value node for minimax tree
+        def minValue(state, depth, agent, actions):     # Calculates min value node for minimax tree
             value = float("inf")
             # get next agent
             if agent == state.getNumAgents() - 1:
@@ -144,7 +768,7 @@ class MinimaxAgent(MultiAgentSearchAgent):
             else:
                 nextAgent = agent + 1
 
-            for act in state.getLegalActions(agent):
+            for act in actions:
                 newValue = MiniMax(state.generateSuccessor(agent, act), depth, nextAgent)[1]
                 if newValue < value:    # find min value
                     value = newValue
@@ -152,10 +776,10 @@ class MinimaxAgent(MultiAgentSearchAgent):
 
             return action, value
 
-        def maxValue(state, depth, agent=0):        # Calculates max value node for minimax tree
+        def maxValue(state, depth, actions, agent=0):   # Calculates max value node for minimax tree
             value = float("-inf")
 
-            for act in state.getLegalActions(agent):
+            for act in actions:
                 newValue = MiniMax(state.generateSuccessor(agent, act), depth, agent + 1)[1]
                 if newValue > value:
                     value = newValue
@@ -164,14 +788,35 @@ class MinimaxAgent(MultiAgentSearchAgent):
             return action, value
 
         def MiniMax(state, depth=0, agent=0):       # Minimax-decision algorithm
-            if not state.getLegalActions(agent) or depth == self.depth:     # Leaf node
+            if self.deadline and time.time() > self.deadline:
+                raise SearchTimeout()
+            if depth == self.searchDepth:   # Leaf node: depth limit
+                self.cutoff = True
                 return '', self.evaluationFunction(state)
-            elif not agent:     # Pac-Man (agent 0) seeks max value
-                return maxValue(state, depth)
+            actions = state.getLegalActions(agent)
+            if not actions:                 # Leaf node: game over
+                return '', self.evaluationFunction(state)
+
+            table = self.transpositionTable
+            if table:       # Same state with as many plies left searched before
+                entry = table.lookup(state, self.searchDepth - depth, agent)
+                if entry:
+                    self.cutoff = True      # The stored search may have stopped at its depth limit
+                    return entry[2], entry[0]
+
+            if not agent:       # Pac-Man (agent 0) seeks max value
+                action, value = maxValue(state, depth, actions)
             else:               # Ghosts (agents 1+) seek min value
-                return minValue(state, depth, agent)
+                action, value = minValue(state, depth, agent, actions)
+
+            if table:
+                table.store(state, self.searchDepth - depth, agent, value, EXACT, action)
+            return action, value
+
+        return MiniMax(state, depth, agent)
 
-        return MiniMax(gameState)[0]
+    def ghostValue(self, values):
+        return min(values)
 
 
 class AlphaBetaAgent(MultiAgentSearchAgent):
@@ -179,13 +824,20 @@ class AlphaBetaAgent(MultiAgentSearchAgent):
       Your minimax agent with alpha-beta pruning (question 3)
     """
 
+    unsupportedOptions = ('workers',)
+
     def getAction(self, gameState):
         """
           Returns the minimax action using self.depth and self.evaluationFunction
+
+          Each node returns its principal variation, the line of best moves below
+          it.  In anytime mode the principal variation of the previous, shallower
+          search is tried first, which makes pruning more effective.
         """
 
-        def minValueAlphaBeta(state, depth, agent, a, b):   # Calculates min value node for alpha-beta tree
+        def minValueAlphaBeta(state, depth, agent, actions, a, b, pv):  # Calculates min value node for alpha-beta tree
             value = float("inf")
+            ply = depth * state.getNumAgents() + agent
             # get next agent
             if agent == state.getNumAgents() - 1:
                 depth += 1
@@ -193,44 +845,87 @@ class AlphaBetaAgent(MultiAgentSearchAgent):
             else:
                 nextAgent = agent + 1
 
-            for act in state.getLegalActions(agent):
-                newValue = MiniMaxAlphaBeta(state.generateSuccessor(agent, act), depth, nextAgent, a, b)[1]
+            for act, successor in self.ordering.children(state, agent, actions, ply, pv):
+                childLine, newValue = MiniMaxAlphaBeta(successor or state.generateSuccessor(agent, act), depth, nextAgent,
+                                                       a, b, pv[1:] if pv and act == pv[0] else ())
                 if newValue < value:    # find min value
                     value = newValue
-                    action = act
+                    line = (act,) + childLine
 
                 if value < a:       # Dont need to search rest of nodes (Pruning)
+                    self.ordering.cutoff(agent, ply, self.searchDepth * state.getNumAgents() - ply, act)
                     break
                 else:
                     b = min(value, b)
 
-            return action, value
+            return line, value
 
-        def maxValueAlphaBeta(state, depth, agent, a, b):   # Calculates max value node for alpha-beta tree
+        def maxValueAlphaBeta(state, depth, agent, actions, a, b, pv):  # Calculates max value node for alpha-beta tree
             value = float("-inf")
+            ply = depth * state.getNumAgents() + agent
 
-            for act in state.getLegalActions(agent):
-                newValue = MiniMaxAlphaBeta(state.generateSuccessor(agent, act), depth, agent + 1, a, b)[1]
+            for act, successor in self.ordering.children(state, agent, actions, ply, pv):
+                childLine, newValue = MiniMaxAlphaBeta(successor or state.generateSuccessor(agent, act), depth, agent + 1,
+                                                       a, b, pv[1:] if pv and act == pv[0] else ())
                 if newValue > value:    # find min value
                     value = newValue
-                    action = act
+                    line = (act,) + childLine
 
                 if value > b:   # Dont need to search rest of nodes (Pruning)
+                    self.ordering.cutoff(agent, ply, self.searchDepth * state.getNumAgents() - ply, act)
                     break
                 else:
                     a = max(value, a)
 
-            return action, value
-
-        def MiniMaxAlphaBeta(state, depth=0, agent=0, a=float("-inf"), b=float("inf")):   # alphabeta-decision algorithm
-            if not state.getLegalActions(agent) or depth == self.depth:     # Leaf node
-                return '', self.evaluationFunction(state)
-            elif not agent:     # agent = 0 is pac-man
-                return maxValueAlphaBeta(state, depth, agent, a, b)
+            return line, value
+
+        def MiniMaxAlphaBeta(state, depth=0, agent=0, a=float("-inf"), b=float("inf"), pv=()):   # alphabeta-decision algorithm
+            if self.deadline and time.time() > self.deadline:
+                raise SearchTimeout()
+            self.nodes += 1
+            if depth == self.searchDepth:   # Leaf node: depth limit
+                self.cutoff = True
+                return (), self.evaluationFunction(state)
+            actions = state.getLegalActions(agent)
+            if not actions:                 # Leaf node: game over
+                return (), self.evaluationFunction(state)
+
+            table = self.transpositionTable
+            if table:       # A stored value or bound may already settle this node for window (a, b)
+                entry = table.lookup(state, self.searchDepth - depth, agent)
+                if entry:
+                    value, bound, action = entry
+                    if bound == EXACT or (bound == LOWER and value >= b) or (bound == UPPER and value <= a):
+                        self.cutoff = True      # The stored search may have stopped at its depth limit
+                        return (action,), value
+
+            if not agent:       # agent = 0 is pac-man
+                line, value = maxValueAlphaBeta(state, depth, agent, actions, a, b, pv)
             else:               # Ghosts (agents 1+)
-                return minValueAlphaBeta(state, depth, agent, a, b)
+                line, value = minValueAlphaBeta(state, depth, agent, actions, a, b, pv)
 
-        return MiniMaxAlphaBeta(gameState)[0]
+            if table:       # Values outside the window are bounds: the search below was cut off
+                if value <= a:
+                    bound = UPPER
+                elif value >= b:
+                    bound = LOWER
+                else:
+                    bound = EXACT
+                table.store(state, self.searchDepth - depth, agent, value, bound, line[0])
+            return line, value
+
+        self.startSearch()
+        gameState = self.searchRoot(gameState)
+        line = self.deepen(lambda pv: MiniMaxAlphaBeta(gameState, pv=pv or ())[0])
+        if self.orderingBaseline:   # Search the depths just searched again, with plain alpha-beta
+            nodes, ordering, table, depth = self.nodes, self.ordering, self.transpositionTable, self.searchDepth
+            self.ordering, self.transpositionTable, self.nodes = MoveOrdering([], [], None), None, 0
+            for self.searchDepth in (self.timeBudget > 0 and range(1, depth + 1) or [depth]):
+                MiniMaxAlphaBeta(gameState)
+            self.orderingStats.append((nodes, self.nodes))
+            self.ordering, self.transpositionTable, self.searchDepth = ordering, table, depth
+        self.finishSearch()
+        return line[0]
 
 
 class ExpectimaxAgent(MultiAgentSearchAgent):
@@ -238,17 +933,36 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
       Your expectimax agent (question 4)
     """
 
+    unsupportedOptions = ('pacmanOrdering', 'ghostOrdering', 'orderingBaseline')
+
     def getAction(self, gameState):
         """
           Returns the expectimax action using self.depth and self.evaluationFunction
 
           All ghosts should be modeled as choosing uniformly at random from their
           legal moves.
+
+          Expectimax visits every move whatever their order, so in anytime mode
+          each deeper search starts afresh.
+        """
+        self.startSearch()
+        if self.workers:
+            action = self.splitRootAction(gameState)
+        else:
+            root = self.searchRoot(gameState)
+            action = self.deepen(lambda previous: self.searchNode(root)[0])
+        self.finishSearch()
+        return action
+
+    def searchNode(self, state, depth=0, agent=0):
+        """
+          Returns the (action, value) of the expectimax tree below state, where
+          agent moves next and depth rounds of moves have been played
         """
 
-        def chanceValue(state, depth, agent):     # Calculate value of chance nodes in expectimax tree
+        def chanceValue(state, depth, agent, actions):    # Calculate value of chance nodes in expectimax tree
             value = 0
-            probability = 1.0 / len(state.getLegalActions(agent))   # 1 / possible moves of ghost
+            probability = 1.0 / len(actions)    # 1 / possible moves of ghost
             # get next agent
             if agent == state.getNumAgents() - 1:
                 depth += 1
@@ -256,17 +970,17 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
             else:
                 nextAgent = agent + 1
 
-            for act in state.getLegalActions(agent):
+            for act in actions:
                 newValue = expectimax(state.generateSuccessor(agent, act), depth, nextAgent)[1]
                 value += probability * newValue
                 action = act
 
             return action, value
 
-        def maxValue(state, depth, agent=0):    # Calculate value of max nodes in expectimax tree
+        def maxValue(state, depth, actions, agent=0):   # Calculate value of max nodes in expectimax tree
             value = float("-inf")   # min possible value
 
-            for act in state.getLegalActions(agent):
+            for act in actions:
                 newValue = expectimax(state.generateSuccessor(agent, act), depth, agent + 1)[1]
                 if newValue > value:
                     value = newValue
@@ -275,14 +989,39 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
             return action, value
 
         def expectimax(state, depth=0, agent=0):
-            if not state.getLegalActions(agent) or depth == self.depth:     # Leaf node
+            if self.deadline and time.time() > self.deadline:
+                raise SearchTimeout()
+            if depth == self.searchDepth:   # Leaf node: depth limit
+                self.cutoff = True
                 return '', self.evaluationFunction(state)
-            elif not agent:     # max value for pac-man
-                return maxValue(state, depth)
+            actions = state.getLegalActions(agent)
+            if not actions:                 # Leaf node: game over
+                return '', self.evaluationFunction(state)
+
+            table = self.transpositionTable
+            if table:       # Same state with as many plies left searched before
+                entry = table.lookup(state, self.searchDepth - depth, agent)
+                if entry:
+                    self.cutoff = True      # The stored search may have stopped at its depth limit
+                    return entry[2], entry[0]
+
+            if not agent:       # max value for pac-man
+                action, value = maxValue(state, depth, actions)
             else:               # min value for ghost
-                return chanceValue(state, depth, agent)
+                action, value = chanceValue(state, depth, agent, actions)
+
+            if table:
+                table.store(state, self.searchDepth - depth, agent, value, EXACT, action)
+            return action, value
+
+        return expectimax(state, depth, agent)
 
-        return expectimax(gameState)[0]
+    def ghostValue(self, values):
+        value = 0
+        probability = 1.0 / len(values)     # Summed in the same order as chanceValue, for the same result
+        for newValue in values:
+            value += probability * newValue
+        return value
 
 
 def betterEvaluationFunction(currentGameState):
@@ -28,7 +28,7 @@ from pprint import PrettyPrinter
 pp = PrettyPrinter()
 
 from game import Agent
-from pacman import GameState
+from pacman import ExploredStates
 from ghostAgents import RandomGhost, DirectionalGhost
 import random, math, traceback, sys, os
 import layout, pacman
@@ -137,8 +137,8 @@ def run(lay, layName, pac, ghosts, disp, nGames=1, name='games'):
     print '*** Running %s on' % name, layName, '%d time(s).' % nGames
     games = pacman.runGames(lay, pac, ghosts, disp, nGames, False, catchExceptions=True, timeout=120)
     print '*** Finished running %s on' % name, layName, 'after %d seconds.' % (time.time() - starttime)
-    stats = {'time': time.time() - starttime, 'wins': [g.state.isWin() for g in games].count(True), 'games': games, 'scores': [g.state.getScore() for g in games],
-             'timeouts': [g.agentTimeout for g in games].count(True), 'crashes': [g.agentCrashed for g in games].count(True)}
+    stats = {'time': time.time() - starttime, 'wins': [g.win for g in games].count(True), 'games': games, 'scores': [g.score for g in games],
+             'timeouts': [g.timedOut for g in games].count(True), 'crashes': [g.crashed for g in games].count(True)}
     print '*** Won %d out of %d games. Average score: %f ***' % (stats['wins'], len(games), sum(stats['scores']) * 1.0 / len(games))
     return stats
 
@@ -166,8 +166,8 @@ class GradingAgent(Agent):
         random.seed(self.seed)
 
     def getAction(self, state):
-        GameState.getAndResetExplored()
-        studentAction = (self.studentAgent.getAction(state), len(GameState.getAndResetExplored()))
+        with ExploredStates() as explored:
+            studentAction = (self.studentAgent.getAction(state), len(explored))
         optimalActions = self.optimalActions[self.stepCount]
         altDepthActions = self.altDepthActions[self.stepCount]
         partialPlyBugActions = self.partialPlyBugActions[self.stepCount]
@@ -268,10 +268,10 @@ class PolyAgent(Agent):
 
     def getAction(self, state):
         # survey agents
-        GameState.getAndResetExplored()
         optimalActionLists = []
         for agent in self.solutionAgents:
-            optimalActionLists.append((agent.getBestPacmanActions(state)[0], len(GameState.getAndResetExplored())))
+            with ExploredStates() as explored:
+                optimalActionLists.append((agent.getBestPacmanActions(state)[0], len(explored)))
         alternativeDepthLists = [agent.getBestPacmanActions(state)[0] for agent in self.alternativeDepthAgents]
         partialPlyBugLists = [agent.getBestPacmanActions(state)[0] for agent in self.partialPlyBugAgents]
         # record responses
@@ -465,9 +465,9 @@ class EvalAgentTest(testClasses.TestCase):
         games = pacman.runGames(lay, agent, self.ghosts, disp, self.numGames, False, catchExceptions=True, timeout=self.maxTime)
         totalTime = time.time() - startTime
 
-        stats = {'time': totalTime, 'wins': [g.state.isWin() for g in games].count(True),
-                 'games': games, 'scores': [g.state.getScore() for g in games],
-                 'timeouts': [g.agentTimeout for g in games].count(True), 'crashes': [g.agentCrashed for g in games].count(True)}
+        stats = {'time': totalTime, 'wins': [g.win for g in games].count(True),
+                 'games': games, 'scores': [g.score for g in games],
+                 'timeouts': [g.timedOut for g in games].count(True), 'crashes': [g.crashed for g in games].count(True)}
 
         averageScore = sum(stats['scores']) / float(len(stats['scores']))
         nonTimeouts = self.numGames - stats['timeouts']
@@ -525,5 +525,80 @@ class EvalAgentTest(testClasses.TestCase):
         return True
 
 
+class StateChangingAgent(Agent):
+    """
+    A Pacman agent that tries to change the food, walls and legal actions of
+    every state it is given before it moves at random.  changed lists what it
+    managed to change.
+    """
+    def __init__(self, index=0):
+        Agent.__init__(self, index)
+        self.changed = []
+
+    def changeGrid(self, name, grid, value):
+        x, y = grid.width / 2, grid.height / 2
+        try:
+            grid[x][y] = value
+            self.changed.append('a cell of the %s' % name)
+        except Exception:
+            pass
+        try:
+            grid[x] = [value] * grid.height
+            self.changed.append('a column of the %s' % name)
+        except Exception:
+            pass
+
+    def getAction(self, state):
+        self.changeGrid('food', state.getFood(), False)
+        self.changeGrid('walls', state.getWalls(), True)
+        legal = state.getLegalActions(self.index)
+        action = random.choice(legal)
+        del legal[:]
+        if not state.getLegalActions(self.index):
+            self.changed.append('the legal actions')
+        return action
+
+
+class ReadOnlyStateTest(testClasses.TestCase):
+    """
+    Plays a game with a StateChangingAgent and checks that it could not
+    change the state of the game: it must have changed nothing, and replaying
+    its moves on a fresh copy of the layout must give the same food and score.
+    """
 
+    def __init__(self, question, testDict):
+        super(ReadOnlyStateTest, self).__init__(question, testDict)
+        self.layoutName = testDict['layoutName']
+        self.seed = int(testDict['randomSeed'])
+
+    def execute(self, grades, moduleDict, solutionDict):
+        lay = layout.getLayout(self.layoutName)
+        agent = StateChangingAgent()
+        ghosts = [RandomGhost(i + 1) for i in range(lay.getNumGhosts())]
+        random.seed(self.seed)
+        rules = pacman.ClassicGameRules()
+        game = rules.newGame(lay, agent, ghosts, self.question.getDisplay(), quiet=True)
+        game.run()
 
+        state = pacman.GameState()
+        state.initialize(layout.Layout(lay.layoutText), len(ghosts))
+        for agentIndex, action in game.moveHistory:
+            state = state.generateSuccessor(agentIndex, action)
+
+        fail = False
+        for changed in agent.changed:
+            self.addMessage('The agent changed %s of a state it was given' % changed)
+            fail = True
+        if not (state.getFood() == game.state.getFood() and state.getScore() == game.state.getScore()):
+            self.addMessage('Replaying the game did not give the food and score it ended with')
+            fail = True
+        if fail:
+            return self.testFail(grades)
+        return self.testPass(grades)
+
+    def writeSolution(self, moduleDict, filePath):
+        handle = open(filePath, 'w')
+        handle.write('# This is the solution file for %s.\n' % self.path)
+        handle.write('# File intentionally blank.\n')
+        handle.close()
+        return True
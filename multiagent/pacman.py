@@ -43,10 +43,11 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
-import util, layout
-import sys, types, time, random, os
+import util, layout, gameRecords
+import sys, types, time, random, os, copy
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -71,25 +72,34 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable holding the active ExploredStates scope, if any, which
+    # records the states generateSuccessor is called on and returns
+    explored = None
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        if GameState.explored is None: return set()
+        tmp = GameState.explored.states
+        GameState.explored.states = set()
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
+
+        The actions of each agent are worked out once per state; every call
+        returns a new list, so callers may change it.
         """
 #        GameState.explored.add(self)
-        if self.isWin() or self.isLose(): return []
-
-        if agentIndex == 0:  # Pacman is moving
-            return PacmanRules.getLegalActions( self )
-        else:
-            return GhostRules.getLegalActions( self, agentIndex )
+        actions = self._legalActions.get( agentIndex )
+        if actions is None:
+            if self.isWin() or self.isLose():
+                actions = ()
+            elif agentIndex == 0:  # Pacman is moving
+                actions = tuple( PacmanRules.getLegalActions( self ) )
+            else:
+                actions = tuple( GhostRules.getLegalActions( self, agentIndex ) )
+            self._legalActions[agentIndex] = actions
+        return list( actions )
 
     def generateSuccessor( self, agentIndex, action):
         """
@@ -112,7 +122,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state, agentIndex )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -120,8 +130,9 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.explored is not None:
+            GameState.explored.add(self)
+            GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -174,7 +185,7 @@ class GameState:
         return self.data.capsules
 
     def getNumFood( self ):
-        return self.data.food.count()
+        return self.data.numFood
 
     def getFood(self):
         """
@@ -185,6 +196,9 @@ class GameState:
 
         currentFood = state.getFood()
         if currentFood[x][y] == True: ...
+
+        The grid is shared with other states and cannot be changed: change
+        a copy() of it instead.
         """
         return self.data.food
 
@@ -225,12 +239,25 @@ class GameState:
             self.data = GameStateData(prevState.data)
         else:
             self.data = GameStateData()
+        self._legalActions = {}  # agentIndex -> tuple of legal actions, filled in by getLegalActions
 
     def deepCopy( self ):
         state = GameState( self )
         state.data = self.data.deepCopy()
         return state
 
+    def agentCopy( self ):
+        """
+        Returns the copy of the state that the Game hands to an agent.  It is
+        cheap to make because it shares the layout and the walls and food
+        grids with this state; the grids are ReadOnlyGrids, so the agent cannot
+        change this state through them.
+        """
+        state = GameState()
+        state.data = self.data.shallowCopy()
+        state._legalActions = self._legalActions
+        return state
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -252,6 +279,47 @@ class GameState:
         Creates an initial game state from a layout array (see layout.py).
         """
         self.data.initialize(layout, numGhostAgents)
+        self._legalActions = {}
+
+class ExploredStates:
+    """
+    A scope in which GameState.generateSuccessor records the states it is
+    called on and the states it returns, for counting the states a search
+    explores:
+
+        with ExploredStates() as explored:
+            action = agent.getAction( state )
+        numExplored = len( explored )
+
+    Outside such a scope no state is hashed or kept.  Scopes may nest: the
+    inner scope records on its own and the outer one carries on after it.
+    With a limit at most that many states are kept; overflowed tells whether
+    more were explored.
+    """
+    def __init__( self, limit=None ):
+        self.states = set()
+        self.limit = limit
+        self.overflowed = False
+        self.outer = None
+
+    def __enter__( self ):
+        self.outer = GameState.explored
+        GameState.explored = self
+        return self
+
+    def __exit__( self, *excInfo ):
+        GameState.explored = self.outer
+        self.outer = None
+        return False
+
+    def add( self, state ):
+        if self.limit is not None and len( self.states ) >= self.limit and state not in self.states:
+            self.overflowed = True
+        else:
+            self.states.add( state )
+
+    def __len__( self ):
+        return len( self.states )
 
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
@@ -346,7 +414,7 @@ class PacmanRules:
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
-        pacmanState.configuration = pacmanState.configuration.generateSuccessor( vector )
+        state.data.moveAgent( 0, pacmanState.configuration.generateSuccessor( vector ) )
 
         # Eat
         next = pacmanState.configuration.getPosition()
@@ -361,21 +429,18 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.removeFood( x, y )
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            if state.data.numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.removeCapsule( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.setScaredTimer( index, SCARED_TIME )
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -408,14 +473,17 @@ class GhostRules:
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
-        ghostState.configuration = ghostState.configuration.generateSuccessor( vector )
+        state.data.moveAgent( ghostIndex, ghostState.configuration.generateSuccessor( vector ) )
     applyAction = staticmethod( applyAction )
 
-    def decrementTimer( ghostState):
+    def decrementTimer( state, ghostIndex ):
+        ghostState = state.data.agentStates[ghostIndex]
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
-        ghostState.scaredTimer = max( 0, timer - 1 )
+            # A new Configuration: the old one is shared with the previous state
+            conf = ghostState.configuration
+            state.data.moveAgent( ghostIndex, Configuration( nearestPoint( conf.pos ), conf.direction ) )
+        state.data.setScaredTimer( ghostIndex, max( 0, timer - 1 ) )
     decrementTimer = staticmethod( decrementTimer )
 
     def checkDeath( state, agentIndex):
@@ -436,8 +504,8 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
-            GhostRules.placeGhost(state, ghostState)
-            ghostState.scaredTimer = 0
+            GhostRules.placeGhost(state, agentIndex)
+            state.data.setScaredTimer( agentIndex, 0 )
             # Added for first-person
             state.data._eaten[agentIndex] = True
         else:
@@ -450,8 +518,8 @@ class GhostRules:
         return manhattanDistance( ghostPosition, pacmanPosition ) <= COLLISION_TOLERANCE
     canKill = staticmethod( canKill )
 
-    def placeGhost(state, ghostState):
-        ghostState.configuration = ghostState.start
+    def placeGhost(state, agentIndex):
+        state.data.moveAgent( agentIndex, state.data.agentStates[agentIndex].start )
     placeGhost = staticmethod( placeGhost )
 
 #############################
@@ -510,9 +578,15 @@ def readCommand( argv ):
     parser.add_option('-f', '--fixRandomSeed', action='store_true', dest='fixRandomSeed',
                       help='Fixes the random seed to always play the same game', default=False)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
-                      help='Writes game histories to a file (named by the time they were played)', default=False)
+                      help='Appends game histories to the game archive given by --recordFile', default=False)
+    parser.add_option('--recordFile', dest='recordFile',
+                      help=default('The game archive games are recorded in'), default='recorded-games')
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A game archive to replay a recorded game from', default=None)
+    parser.add_option('--replayGame', dest='replayIndex', type='int',
+                      help=default('The number of the game in the archive to replay'), default=1)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int',
+                      help=default('The move to fast-forward a replay to before displaying it'), default=0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -523,6 +597,11 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes to play games in, without graphics (0 plays them here)'), default=0)
+    parser.add_option('--resultsFile', dest='resultsFile',
+                      help='Writes the result of each game to a file as it ends (CSV if it ends in .csv, else JSON lines)',
+                      default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -568,18 +647,25 @@ def readCommand( argv ):
         args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime = options.frameTime)
     args['numGames'] = options.numGames
     args['record'] = options.record
+    args['recordFile'] = options.recordFile
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['resultsFile'] = options.resultsFile
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
-        print 'Replaying recorded game %s.' % options.gameToReplay
-        import cPickle
-        f = open(options.gameToReplay)
-        try: recorded = cPickle.load(f)
-        finally: f.close()
-        recorded['display'] = args['display']
-        replayGame(**recorded)
+        if not os.path.isfile(options.gameToReplay):
+            parser.error('There is no game archive %s' % options.gameToReplay)
+        archive = gameRecords.GameArchive(options.gameToReplay)
+        try:
+            if not 1 <= options.replayIndex <= len(archive):
+                parser.error('--replayGame must be between 1 and %d, the number of games in %s' %
+                             (len(archive), options.gameToReplay))
+            recorded = archive[options.replayIndex - 1]
+        finally: archive.close()
+        print 'Replaying recorded game %d of %s.' % (options.replayIndex, options.gameToReplay)
+        replayGame(recorded, args['display'], options.replayFrom)
         sys.exit(0)
 
     return args
@@ -607,17 +693,64 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
+class GameReplay:
+    """
+    Random access to the states of a recorded game (a gameRecords.GameRecord),
+    without agents or a display.  State number move is the state after that
+    many moves; a replay seeks to it from the last snapshot of the record
+    before it rather than from the start of the game.  A last action that
+    raised in the recorded game is not replayed.
+    """
+    def __init__( self, record ):
+        self.record = record
+        self.layout = record.getLayout()
+        self.moveHistory = record.getMoves()
+
+    def __len__( self ):
+        return len( self.moveHistory ) + 1
+
+    def initialState( self ):
+        state = GameState()
+        state.initialize( self.layout, self.record.numAgents - 1 )
+        return state
+
+    def getState( self, move ):
+        "Returns state number move"
+        return self.states( move ).next()
+
+    def states( self, start=0 ):
+        "Generates the states of the game from state number start on"
+        if start < 0: start += len( self )
+        if not 0 <= start < len( self ): raise IndexError( 'The game has no state %d' % start )
+        state = self.initialState()
+        move = 0
+        interval = self.record.snapshotInterval
+        if interval > 0 and start >= interval and self.record.snapshots:
+            snapshot = min( start / interval, len( self.record.snapshots ) )
+            gameRecords.restoreSnapshot( state.data, self.record.snapshots[snapshot - 1] )
+            move = snapshot * interval
+        for agentIndex, action in self.moveHistory[move:start]:
+            state = state.generateSuccessor( agentIndex, action )
+        yield state
+        for agentIndex, action in self.moveHistory[start:]:
+            state = state.generateSuccessor( agentIndex, action )
+            yield state
+
+def replayGame( record, display, start=0 ):
+    """
+    Shows a recorded game (a gameRecords.GameRecord) on display from state
+    number start, which is reached without the display.
+    """
     import pacmanAgents, ghostAgents
     rules = ClassicGameRules()
-    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts())]
-    game = rules.newGame( layout, agents[0], agents[1:], display )
-    state = game.state
+    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(record.numAgents - 1)]
+    replay = GameReplay( record )
+    game = rules.newGame( replay.layout, agents[0], agents[1:], display )
+    states = replay.states( start )
+    state = states.next()
     display.initialize(state.data)
 
-    for action in actions:
-            # Execute the action
-        state = state.generateSuccessor( *action )
+    for state in states:
         # Change the display
         display.update( state.data )
         # Allow for game specific conditions (winning, losing, etc.)
@@ -625,12 +758,166 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+class GameResult:
+    """
+    The outcome of game number index of runGames, which is all that runGames
+    keeps of the game.
+    """
+    def __init__( self, index, game ):
+        self.index = index
+        self.score = game.state.getScore()
+        self.win = game.state.isWin()
+        self.numMoves = len( game.moveHistory )
+        self.crashed = game.agentCrashed
+        self.timedOut = game.agentTimeout
+        self.agentTimes = list( game.totalAgentTimes )
+
+    def asDict( self ):
+        return {'game': self.index + 1, 'score': self.score, 'win': self.win, 'moves': self.numMoves,
+                'crashed': self.crashed, 'timedOut': self.timedOut, 'agentTimes': self.agentTimes}
+
+class ResultsFile:
+    """
+    Writes one line per GameResult to a file as soon as its game ends: comma
+    separated values if the file name ends in .csv, with one agentTime column
+    per agent, and a JSON object per line otherwise.
+    """
+    FIELDS = ['game', 'score', 'win', 'moves', 'crashed', 'timedOut']
+
+    def __init__( self, fname ):
+        self.file = open( fname, 'w' )
+        self.csv = None
+        if fname.endswith( '.csv' ):
+            import csv
+            self.csv = csv.writer( self.file )
+
+    def write( self, result ):
+        record = result.asDict()
+        if self.csv is None:
+            import json
+            self.file.write( json.dumps( record, sort_keys=True ) + '\n' )
+        else:
+            if self.file.tell() == 0:
+                self.csv.writerow( self.FIELDS + ['agentTime%d' % i for i in range( len( result.agentTimes ) )] )
+            self.csv.writerow( [record[field] for field in self.FIELDS] + result.agentTimes )
+        self.file.flush()
+
+    def close( self ):
+        self.file.close()
+
+# Game components of a worker process of runGames
+_gameWorker = {}
+
+def _startGameWorker( layout, pacman, ghosts, record, catchExceptions, timeout ):
+    _gameWorker.update( layout=layout, pacman=pacman, ghosts=ghosts, record=record,
+                        catchExceptions=catchExceptions, rules=ClassicGameRules( timeout ) )
+
+def _playGame( task ):
+    """
+    Plays game number index of runGames from its own random seed and returns
+    its GameResult.  The game gets fresh copies of the agents, so it does not
+    depend on the games the worker played before it.
+    """
+    import textDisplay
+    index, seed = task
+    random.seed( seed )
+    worker = _gameWorker
+    pacman, ghosts = copy.deepcopy( (worker['pacman'], worker['ghosts']) )
+    game = worker['rules'].newGame( worker['layout'], pacman, ghosts, textDisplay.NullGraphics(),
+                                    True, worker['catchExceptions'] )
+    game.run()
+    result = GameResult( index, game )
+    if worker['record']:
+        result.record = gameRecords.GameRecord.fromGame( worker['layout'], game, index, seed )
+    return result
+
+def runGamesInParallel( layout, pacman, ghosts, numGames, archive, catchExceptions, timeout, workers, results=None ):
+    """
+    Plays numGames games in a pool of worker processes and returns their
+    GameResults ordered by game index.  Game i starts from random seed
+    baseSeed + i, with baseSeed drawn from the random module here, so the
+    games only depend on the seed (see --fixRandomSeed) and not on the number
+    of workers or the order in which the games finish.  Each result is
+    printed, and written to the ResultsFile results if there is one, as soon
+    as its game ends, when the game is also appended to the GameArchive
+    archive if there is one.
+    """
+    import multiprocessing
+    baseSeed = random.randrange( 2 ** 31 )
+    pool = multiprocessing.Pool( min( workers, numGames ), _startGameWorker,
+                                 (layout, pacman, ghosts, archive is not None, catchExceptions, timeout) )
+    games = [None] * numGames
+    try:
+        tasks = [(i, baseSeed + i) for i in range( numGames )]
+        for result in pool.imap_unordered( _playGame, tasks ):
+            games[result.index] = result
+            print 'Game %d: %s, score %d after %d moves' % (result.index + 1, ['Loss', 'Win'][int(result.win)],
+                                                            result.score, result.numMoves)
+            if results is not None:
+                results.write( result )
+            if archive is not None:
+                archive.append( result.record )
+                del result.record
+        pool.close()
+    finally:
+        pool.terminate()
+    return games
+
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30,
+              workers=0, resultsFile=None, recordFile='recorded-games' ):
+    """
+    Plays numGames games and prints a summary of the games that were not for
+    training.  Returns the GameResults of those games.  With workers > 0 the games
+    are played without graphics by that many worker processes.  The result of
+    each game that is not for training is written to resultsFile (see
+    ResultsFile) as soon as the game ends.  With record, every game is
+    appended to the game archive recordFile (see gameRecords).
+    """
     import __main__
     __main__.__dict__['_display'] = display
 
+    if workers > 0 and numTraining > 0:
+        raise Exception('Games with training episodes cannot be played by workers')
+    if workers > 0 and getattr(pacman, 'workers', 0) > 0:
+        # Worker processes are daemons, which multiprocessing does not let start pools of their own
+        raise Exception('Games cannot be played by workers when the Pacman agent searches with workers of its own '
+                        '(-a workers=N): use one or the other')
+    results = None
+    if resultsFile is not None:
+        results = ResultsFile( resultsFile )
+    archive = None
+    try:
+        if record:
+            archive = gameRecords.GameArchive( recordFile )
+        if workers > 0:
+            games = runGamesInParallel( layout, pacman, ghosts, numGames, archive, catchExceptions, timeout, workers,
+                                        results )
+            scores = [game.score for game in games]
+            wins = [game.win for game in games]
+        else:
+            games, scores, wins = runGamesInSequence( layout, pacman, ghosts, display, numGames, numTraining,
+                                                      catchExceptions, timeout, results, archive )
+    finally:
+        if results is not None:
+            results.close()
+        if archive is not None:
+            archive.close()
+
+    if scores:
+        printSummary( scores, wins )
+    return games
+
+def runGamesInSequence( layout, pacman, ghosts, display, numGames, numTraining, catchExceptions, timeout, results,
+                        archive ):
+    """
+    Plays the games of runGames one after the other and returns the
+    GameResults of the games that were not for training and their scores and
+    wins.
+    """
     rules = ClassicGameRules(timeout)
     games = []
+    scores = []
+    wins = []
 
     for i in range( numGames ):
         beQuiet = i < numTraining
@@ -644,26 +931,26 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
             rules.quiet = False
         game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
         game.run()
-        if not beQuiet: games.append(game)
-
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
-
-    if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print 'Average Score:', sum(scores) / float(len(scores))
-        print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
-
-    return games
+        if not beQuiet:
+            scores.append( game.state.getScore() )
+            wins.append( game.state.isWin() )
+            result = GameResult( i, game )
+            if results is not None:
+                results.write( result )
+            games.append( result )
+
+        if archive is not None:
+            archive.append( gameRecords.GameRecord.fromGame( layout, game, i ) )
+
+    return games, scores, wins
+
+def printSummary( scores, wins ):
+    "Prints the scores and wins of a series of games"
+    winRate = wins.count(True)/ float(len(wins))
+    print 'Average Score:', sum(scores) / float(len(scores))
+    print 'Scores:       ', ', '.join([str(score) for score in scores])
+    print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
+    print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
 
 if __name__ == '__main__':
     """
@@ -333,6 +333,9 @@ if __name__ == '__main__':
     options = readCommand(sys.argv)
     if options.generateSolutions:
         confirmGenerate()
+    # Grade with freshly computed maze distances, never tables cached on disk
+    import distanceCalculator
+    distanceCalculator.DISTANCE_CACHE_DIR = ''
     codePaths = options.studentCode.split(',')
     # moduleCodeDict = {}
     # for cp in codePaths:
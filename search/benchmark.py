@@ -0,0 +1,190 @@
+# benchmark.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Timing benchmarks for the data structures and searches of the search project.
+
+Run one benchmark by name, for example:
+
+> python benchmark.py priorityQueue --sizes 100000,1000000
+> python benchmark.py corners --layouts mediumCorners,bigCorners
+"""
+
+import random
+import time
+import util
+
+
+def timed(function, *args):
+    "Returns the number of seconds function(*args) takes to run"
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def benchmarkPriorityQueue(sizes, numUpdates, numSlowUpdates):
+    """
+    Compares util.PriorityQueue with util.IndexedPriorityQueue on frontiers of
+    the given sizes: push every item, lower the priority of some of them with
+    update, then pop everything.
+
+    PriorityQueue.update scans and re-heapifies the whole heap, so it only gets
+    numSlowUpdates calls; times are reported per operation.
+    """
+    print '%-22s %10s %14s %14s %14s' % ('queue', 'size', 'push (us)', 'update (us)', 'pop (us)')
+    for size in sizes:
+        rand = random.Random(size)
+        priorities = [rand.random() for i in range(size)]
+        for queueClass, updates in [(util.PriorityQueue, numSlowUpdates), (util.IndexedPriorityQueue, numUpdates)]:
+            queue = queueClass()
+            decreased = [(rand.randrange(size), rand.random() / 2) for i in range(updates)]
+
+            def pushAll():
+                for item, priority in enumerate(priorities):
+                    queue.push(item, priority)
+
+            def updateSome():
+                for item, priority in decreased:
+                    queue.update(item, priority)
+
+            def popAll():
+                while not queue.isEmpty():
+                    queue.pop()
+
+            pushTime = timed(pushAll)
+            updateTime = timed(updateSome)
+            popTime = timed(popAll)
+            print '%-22s %10d %14.2f %14.2f %14.2f' % (queueClass.__name__, size, 1e6 * pushTime / size,
+                                                       1e6 * updateTime / max(1, updates), 1e6 * popTime / size)
+
+
+class TupleCornersProblem:
+    """
+    The former CornersProblem state space, kept as a reference for the corners
+    benchmark: a state is (position, tuple of corners still to visit).
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.corners = problem.corners
+        self.walls = problem.walls
+        self._expanded = 0
+
+    def getStartState(self):
+        return (self.problem.startingPosition, self.corners)
+
+    def isGoalState(self, state):
+        return not state[1]
+
+    def getSuccessors(self, state):
+        from game import Actions, Directions
+        successors = []
+        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
+            x, y = state[0]
+            dx, dy = Actions.directionToVector(action)
+            nextx, nexty = int(x + dx), int(y + dy)
+            if not self.walls[nextx][nexty]:
+                nextState = (nextx, nexty)
+                newDests = state[1]
+                if nextState in newDests:
+                    newDests = tuple(corner for corner in newDests if corner != nextState)
+                successors.append(((nextState, newDests), action, 1))
+        self._expanded += 1
+        return successors
+
+
+def tupleCornersHeuristic(state, problem):
+    "The former cornersHeuristic on TupleCornersProblem states"
+    position, destinations = state
+    if problem.isGoalState(state):
+        return 0
+    return max(map(lambda corner: util.manhattanDistance(position, corner), list(destinations)))
+
+
+def benchmarkCorners(layoutNames, repeats):
+    """
+    Runs breadth first search and A* with the corners heuristic on the
+    CornersProblem of each layout, once with the former tuple state and once
+    with the current (position, visited mask) state, and reports expansions
+    per second.  Both state spaces must find paths of the same cost with the
+    same number of expansions.
+    """
+    import layout
+    import pacman
+    import search
+    import searchAgents
+
+    print '%-16s %-7s %-8s %10s %10s %14s' % ('layout', 'search', 'state', 'cost', 'expanded', 'expanded/s')
+    for layoutName in layoutNames:
+        gameState = pacman.GameState()
+        gameState.initialize(layout.getLayout(layoutName), 0)
+        for searchName in ['bfs', 'astar']:
+            results = []
+            for stateName in ['tuple', 'mask']:
+                problem = searchAgents.CornersProblem(gameState)
+                if stateName == 'tuple':
+                    problem, heuristic = TupleCornersProblem(problem), tupleCornersHeuristic
+                else:
+                    heuristic = searchAgents.cornersHeuristic
+                if searchName == 'bfs':
+                    run = lambda: search.breadthFirstSearch(problem)
+                else:
+                    run = lambda: search.aStarSearch(problem, heuristic)
+
+                seconds = min([timed(run) for i in range(repeats)])
+                expanded = problem._expanded / repeats
+                path = run()
+                results.append((len(path), expanded))
+                print '%-16s %-7s %-8s %10d %10d %14.0f' % (layoutName, searchName, stateName, len(path),
+                                                            expanded, expanded / max(seconds, 1e-9))
+            if results[0] != results[1]:
+                raise Exception('Corner states disagree on %s with %s: %s' % (layoutName, searchName, results))
+
+
+BENCHMARKS = {
+    'priorityQueue': lambda options: benchmarkPriorityQueue(options.sizes, options.updates, options.slowUpdates),
+    'corners': lambda options: benchmarkCorners(options.layouts, options.repeats),
+}
+
+
+def readCommand(argv):
+    "Processes the command used to run the benchmarks from the command line."
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python benchmark.py <benchmark> <options>
+    BENCHMARKS: %s
+    """ % ', '.join(sorted(BENCHMARKS.keys()))
+    parser = OptionParser(usageStr)
+    parser.add_option('--sizes', dest='sizes', default='100000,1000000',
+                      help='Comma separated frontier sizes [Default: %default]')
+    parser.add_option('--updates', dest='updates', type='int', default=100000,
+                      help='Number of update calls on IndexedPriorityQueue [Default: %default]')
+    parser.add_option('--slowUpdates', dest='slowUpdates', type='int', default=10,
+                      help='Number of update calls on PriorityQueue [Default: %default]')
+    parser.add_option('--layouts', dest='layouts', default='mediumCorners,bigCorners',
+                      help='Comma separated layouts for the corners benchmark [Default: %default]')
+    parser.add_option('--repeats', dest='repeats', type='int', default=5,
+                      help='Runs per search, the fastest one is reported [Default: %default]')
+    options, names = parser.parse_args(argv)
+    if len(names) != 1 or names[0] not in BENCHMARKS:
+        parser.error('Choose one benchmark from: ' + ', '.join(sorted(BENCHMARKS.keys())))
+    options.sizes = [int(size) for size in options.sizes.split(',')]
+    options.layouts = options.layouts.split(',')
+    return names[0], options
+
+
+if __name__ == '__main__':
+    import sys
+    name, options = readCommand(sys.argv[1:])
+    BENCHMARKS[name](options)
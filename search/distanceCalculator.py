@@ -0,0 +1,219 @@
+# distanceCalculator.py
+# ---------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+All-pairs maze distances for a walls Grid (see game.py).
+
+The table is computed once per distinct maze with a BFS from every free cell
+and is then shared by every search problem and game state on the same walls:
+
+  distances = getMazeDistances(gameState.getWalls())
+  distances.getDistance((1, 1), (5, 3))
+
+Tables can also be cached on disk.  Setting the PACMAN_DISTANCE_CACHE
+environment variable to a directory turns the cache on: computed tables are
+written there, one binary file per maze named by a hash of its walls, and
+later processes memory-map that file read-only instead of recomputing it.
+Processes that map the same file share a single copy in the OS page cache.
+The directory is created private to the user and only files owned by the user
+are loaded, so other users cannot plant tables with wrong distances.  The
+cache is off by default, and the autograder always turns it off.
+"""
+
+import array
+import ctypes
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+UNREACHABLE = 0xFFFF    # Stored for pairs of cells with no path between them
+
+DISTANCE_TABLE_CACHE = {}   # str(walls) -> MazeDistances
+
+DISTANCE_CACHE_DIR = os.environ.get('PACMAN_DISTANCE_CACHE', '')
+
+# Cache file layout: magic, width, height and number of free cells, followed by
+# the numCells * numCells table as little-endian unsigned shorts
+FILE_MAGIC = 'PMD1'
+FILE_HEADER = struct.Struct('<4sHHI')
+FILE_ENTRY = ctypes.c_uint16.__ctype_le__
+
+
+class MazeDistances:
+    """
+    Maze distances between every pair of free cells of a walls Grid.
+
+    Free cells are numbered 0..n-1 and the distances are kept in one flat array
+    of n*n unsigned shorts, so the whole table of a large layout takes a few
+    megabytes at most and a lookup is two index computations.
+    """
+
+    def __init__(self, walls, distances=None):
+        """
+        Numbers the free cells of walls and computes their distances, unless a
+        table for these walls (such as one mapped from the cache) is passed in.
+        """
+        self.width = walls.width
+        self.height = walls.height
+        self.cells = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+        self.cellIndex = [-1] * (walls.width * walls.height)    # x * height + y -> free cell number
+        for index, (x, y) in enumerate(self.cells):
+            self.cellIndex[x * self.height + y] = index
+        if distances is None:
+            distances = self._computeDistances()
+        self.distances = distances
+
+    def _computeDistances(self):
+        "Runs a breadth first search from every free cell"
+        numCells = len(self.cells)
+        neighbors = []
+        for x, y in self.cells:
+            adjacent = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+            neighbors.append([self.getCellIndex(cell) for cell in adjacent if self.getCellIndex(cell) >= 0])
+
+        distances = array.array('H', [UNREACHABLE]) * (numCells * numCells)
+        for source in range(numCells):
+            row = source * numCells
+            distances[row + source] = 0
+            frontier, distance = [source], 0
+            while frontier:
+                distance += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighbors[cell]:
+                        if distances[row + neighbor] == UNREACHABLE:
+                            distances[row + neighbor] = distance
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+        return distances
+
+    def getCellIndex(self, position):
+        "Returns the free cell number of position, or -1 for walls and cells off the board"
+        x, y = position
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return -1
+        return self.cellIndex[x * self.height + y]
+
+    def getDistance(self, pos1, pos2):
+        """
+        Returns the maze distance between two free cells, or None if pos2
+        cannot be reached from pos1.
+        """
+        index1, index2 = self.getCellIndex(pos1), self.getCellIndex(pos2)
+        if index1 < 0 or index2 < 0:
+            raise Exception('Maze distances are only defined between free cells: %s, %s' % (pos1, pos2))
+        distance = self.distances[index1 * len(self.cells) + index2]
+        if distance == UNREACHABLE:
+            return None
+        return distance
+
+
+def getCacheFileName(key):
+    "Returns the cache file of the maze whose walls print as key"
+    return os.path.join(DISTANCE_CACHE_DIR, hashlib.sha1(key).hexdigest() + '.dist')
+
+
+def loadMazeDistances(walls, fileName):
+    """
+    Memory-maps a cached distance table for walls.  Returns None if there is
+    no usable cache file: one that is missing, not owned by the current user
+    or not a table of the size walls needs.
+
+    The table is a ctypes array laid over the mapping, so lookups cost about
+    as much as in a computed array.  The mapping is copy-on-write because
+    ctypes only lays arrays over writable buffers, but nothing writes to it,
+    so its pages stay shared with the page cache.
+    """
+    try:
+        f = open(fileName, 'rb')
+    except IOError:
+        return None
+    try:
+        info = os.fstat(f.fileno())
+        if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+            return None
+        if info.st_size < FILE_HEADER.size:
+            return None
+        try:
+            mappedFile = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (mmap.error, ValueError):
+            return None
+    finally:
+        f.close()
+
+    magic, width, height, numCells = FILE_HEADER.unpack_from(mappedFile, 0)
+    numEntries = numCells * numCells
+    if magic != FILE_MAGIC or (width, height) != (walls.width, walls.height) or \
+            len(mappedFile) != FILE_HEADER.size + ctypes.sizeof(FILE_ENTRY) * numEntries:
+        return None
+    table = (FILE_ENTRY * numEntries).from_buffer(mappedFile, FILE_HEADER.size)
+    distances = MazeDistances(walls, table)
+    if len(distances.cells) != numCells:
+        return None
+    return distances
+
+
+def saveMazeDistances(distances, fileName):
+    """
+    Writes a computed distance table to its cache file.  The file is written
+    under a temporary name and then renamed, so concurrent processes never
+    map a partially written table.  Failures are ignored; the table stays in
+    memory either way.
+    """
+    table = distances.distances
+    if sys.byteorder != 'little':
+        table = array.array(table.typecode, table)
+        table.byteswap()
+    try:
+        if not os.path.isdir(DISTANCE_CACHE_DIR):
+            os.makedirs(DISTANCE_CACHE_DIR, 0700)
+        fd, tempName = tempfile.mkstemp(dir=DISTANCE_CACHE_DIR)
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(FILE_HEADER.pack(FILE_MAGIC, distances.width, distances.height, len(distances.cells)))
+            table.tofile(f)
+        finally:
+            f.close()
+        try:
+            os.rename(tempName, fileName)
+        except OSError:     # Another process got there first (Windows does not replace files on rename)
+            os.remove(tempName)
+    except (IOError, OSError):
+        pass
+
+
+def getMazeDistances(walls):
+    """
+    Returns the MazeDistances of a walls Grid.  A maze seen earlier in this
+    process reuses its table, then the on-disk cache is tried, and the table is
+    only computed (and saved) when neither has it.  The table is also
+    remembered on the Grid itself so that later lookups skip hashing the walls.
+    """
+    distances = getattr(walls, 'mazeDistances', None)
+    if distances is None:
+        key = str(walls)
+        if key not in DISTANCE_TABLE_CACHE:
+            distances = None
+            if DISTANCE_CACHE_DIR:
+                distances = loadMazeDistances(walls, getCacheFileName(key))
+            if distances is None:
+                distances = MazeDistances(walls)
+                if DISTANCE_CACHE_DIR:
+                    saveMazeDistances(distances, getCacheFileName(key))
+            DISTANCE_TABLE_CACHE[key] = distances
+        distances = walls.mazeDistances = DISTANCE_TABLE_CACHE[key]
+    return distances
@@ -33,6 +33,9 @@ class Layout:
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
+        # Every state of a game shares the walls and food of its layout
+        self.walls = self.walls.readOnly()
+        self.food = self.food.readOnly()
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
         # self.initializeVisibilityMatrix()
@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -71,11 +72,13 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable holding the active ExploredStates scope, if any, which
+    # records the states generateSuccessor is called on and returns
+    explored = None
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        if GameState.explored is None: return set()
+        tmp = GameState.explored.states
+        GameState.explored.states = set()
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
@@ -112,7 +115,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state, agentIndex )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -120,8 +123,9 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.explored is not None:
+            GameState.explored.add(self)
+            GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -174,7 +178,7 @@ class GameState:
         return self.data.capsules
 
     def getNumFood( self ):
-        return self.data.food.count()
+        return self.data.numFood
 
     def getFood(self):
         """
@@ -185,6 +189,9 @@ class GameState:
 
         currentFood = state.getFood()
         if currentFood[x][y] == True: ...
+
+        The grid is shared with other states and cannot be changed: change
+        a copy() of it instead.
         """
         return self.data.food
 
@@ -231,6 +238,17 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def agentCopy( self ):
+        """
+        Returns the copy of the state that the Game hands to an agent.  It is
+        cheap to make because it shares the layout and the walls and food
+        grids with this state; the grids are ReadOnlyGrids, so the agent cannot
+        change this state through them.
+        """
+        state = GameState()
+        state.data = self.data.shallowCopy()
+        return state
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -253,6 +271,46 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+class ExploredStates:
+    """
+    A scope in which GameState.generateSuccessor records the states it is
+    called on and the states it returns, for counting the states a search
+    explores:
+
+        with ExploredStates() as explored:
+            action = agent.getAction( state )
+        numExplored = len( explored )
+
+    Outside such a scope no state is hashed or kept.  Scopes may nest: the
+    inner scope records on its own and the outer one carries on after it.
+    With a limit at most that many states are kept; overflowed tells whether
+    more were explored.
+    """
+    def __init__( self, limit=None ):
+        self.states = set()
+        self.limit = limit
+        self.overflowed = False
+        self.outer = None
+
+    def __enter__( self ):
+        self.outer = GameState.explored
+        GameState.explored = self
+        return self
+
+    def __exit__( self, *excInfo ):
+        GameState.explored = self.outer
+        self.outer = None
+        return False
+
+    def add( self, state ):
+        if self.limit is not None and len( self.states ) >= self.limit and state not in self.states:
+            self.overflowed = True
+        else:
+            self.states.add( state )
+
+    def __len__( self ):
+        return len( self.states )
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -346,7 +404,7 @@ class PacmanRules:
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
-        pacmanState.configuration = pacmanState.configuration.generateSuccessor( vector )
+        state.data.moveAgent( 0, pacmanState.configuration.generateSuccessor( vector ) )
 
         # Eat
         next = pacmanState.configuration.getPosition()
@@ -361,21 +419,18 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.removeFood( x, y )
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            if state.data.numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.removeCapsule( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.setScaredTimer( index, SCARED_TIME )
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -408,14 +463,17 @@ class GhostRules:
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
-        ghostState.configuration = ghostState.configuration.generateSuccessor( vector )
+        state.data.moveAgent( ghostIndex, ghostState.configuration.generateSuccessor( vector ) )
     applyAction = staticmethod( applyAction )
 
-    def decrementTimer( ghostState):
+    def decrementTimer( state, ghostIndex ):
+        ghostState = state.data.agentStates[ghostIndex]
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
-        ghostState.scaredTimer = max( 0, timer - 1 )
+            # A new Configuration: the old one is shared with the previous state
+            conf = ghostState.configuration
+            state.data.moveAgent( ghostIndex, Configuration( nearestPoint( conf.pos ), conf.direction ) )
+        state.data.setScaredTimer( ghostIndex, max( 0, timer - 1 ) )
     decrementTimer = staticmethod( decrementTimer )
 
     def checkDeath( state, agentIndex):
@@ -436,8 +494,8 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
-            GhostRules.placeGhost(state, ghostState)
-            ghostState.scaredTimer = 0
+            GhostRules.placeGhost(state, agentIndex)
+            state.data.setScaredTimer( agentIndex, 0 )
             # Added for first-person
             state.data._eaten[agentIndex] = True
         else:
@@ -450,8 +508,8 @@ class GhostRules:
         return manhattanDistance( ghostPosition, pacmanPosition ) <= COLLISION_TOLERANCE
     canKill = staticmethod( canKill )
 
-    def placeGhost(state, ghostState):
-        ghostState.configuration = ghostState.start
+    def placeGhost(state, agentIndex):
+        state.data.moveAgent( agentIndex, state.data.agentStates[agentIndex].start )
     placeGhost = staticmethod( placeGhost )
 
 #############################
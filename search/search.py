@@ -19,6 +19,10 @@ Pacman agents (in searchAgents.py).
 
 import util
 
+# When True, UCS and A* cross-check the g(n) they accumulated from step costs
+# against problem.getCostOfActions once, on the path they return.
+VERIFY_PATH_COST = False
+
 
 class SearchProblem:
     """
@@ -74,6 +78,38 @@ def tinyMazeSearch(problem):
     return [s, s, w, s, w, w, s, w]
 
 
+class SearchNodes:
+    """
+    A flat store of search tree nodes shared by all the graph searches below.
+
+    Node i is described by parents[i], actions[i] and costs[i] (its g(n)); the
+    root has parent None.  Frontier entries only carry a node index, and the
+    action list is rebuilt once by following parent pointers back to the root,
+    so pushing a node costs O(1) instead of copying its whole path.
+    """
+
+    def __init__(self):
+        self.parents = []
+        self.actions = []
+        self.costs = []
+
+    def add(self, parent, action, cost):
+        "Stores a new node and returns its index"
+        self.parents.append(parent)
+        self.actions.append(action)
+        self.costs.append(cost)
+        return len(self.parents) - 1
+
+    def path(self, node):
+        "Returns the list of actions that leads from the root to node"
+        path = []
+        while self.parents[node] is not None:
+            path.append(self.actions[node])
+            node = self.parents[node]
+        path.reverse()
+        return path
+
+
 def depthFirstSearch(problem):
     """
     Search the deepest nodes in the search tree first.
@@ -89,22 +125,24 @@ def depthFirstSearch(problem):
     print "Start's successors:", problem.getSuccessors(problem.getStartState())
     """
 
-    explored = []  # Keeps track of all explored states
+    nodes = SearchNodes()  # Parent pointers used to rebuild the path at the goal
+    explored = set()  # Hashed closed set of all explored states
     frontier = util.Stack()  # Use stack as frontier in DFS
-    frontier.push((problem.getStartState(), []))  # Init frontier with start state and path to state []
+    frontier.push((problem.getStartState(), nodes.add(None, None, 0)))  # Init frontier with start state and root node
 
     while not frontier.isEmpty():  # Break loop if frontier is empty
-        state, path = frontier.pop()
+        state, node = frontier.pop()
 
         if problem.isGoalState(state):  # If goal is reached return path
-            return path
+            return nodes.path(node)
 
-        explored.append(state)  # add state to explores list
+        explored.add(state)  # add state to explored set
         successors = problem.getSuccessors(state)  # Get all successors of current state
 
-        for childState, direction, _ in successors:
+        for childState, direction, stepCost in successors:
             if childState not in explored:  # For all non visited successors
-                frontier.push((childState, path + [direction]))  # push successor node to frontier
+                childNode = nodes.add(node, direction, nodes.costs[node] + stepCost)
+                frontier.push((childState, childNode))  # push successor node to frontier
 
     return []  # Error (Can't find solution)
 
@@ -114,22 +152,25 @@ def depthFirstSearch(problem):
 def breadthFirstSearch(problem):
     """Search the shallowest nodes in the search tree first."""
 
-    explored = []  # Keeps track of all explored states
+    nodes = SearchNodes()  # Parent pointers used to rebuild the path at the goal
+    startState = problem.getStartState()
+    reached = set([startState])  # States that are either explored or waiting in the frontier
     frontier = util.Queue()  # Use Queue as frontier in BFS
-    frontier.push((problem.getStartState(), []))  # Init frontier with start state and path to state []
+    frontier.push((startState, nodes.add(None, None, 0)))  # Init frontier with start state and root node
 
     while not frontier.isEmpty():  # Break loop if Queue is empty
-        state, path = frontier.pop()
+        state, node = frontier.pop()
 
         if problem.isGoalState(state):  # If goal is reached return path
-            return path
+            return nodes.path(node)
 
-        explored.append(state)  # add state to explores list
         successors = problem.getSuccessors(state)  # Get all successors of current state
 
-        for childState, direction, _ in successors:  # For all non visited successors
-            if childState not in explored and childState not in (node[0] for node in frontier.list):
-                frontier.push((childState, path + [direction]))  # push successor node to frontier
+        for childState, direction, stepCost in successors:  # For all successors not explored or in frontier
+            if childState not in reached:
+                reached.add(childState)
+                childNode = nodes.add(node, direction, nodes.costs[node] + stepCost)
+                frontier.push((childState, childNode))  # push successor node to frontier
 
     return []  # Error (Can't find solution)
 
@@ -139,74 +180,153 @@ def breadthFirstSearch(problem):
 def uniformCostSearch(problem):
     """Search the node of least total cost first."""
 
-    explored = []  # Keeps track of all explored states
-    frontier = util.PriorityQueue()  # Use Priority Queue as frontier in UCS
-    frontier.push((problem.getStartState(), []), 0)  # Init frontier with (start state,[]) and priority 0
+    return bestFirstSearch(problem)     # UCS is best-first search on g(n) alone
+
+    util.raiseNotDefined()
+
+
+def nullHeuristic(state, problem=None):
+    """
+    A heuristic function estimates the cost from the current state to the nearest
+    goal in the provided SearchProblem.  This heuristic is trivial.
+    """
+    return 0
+
+
+def aStarSearch(problem, heuristic=nullHeuristic):
+    """Search the node that has the lowest combined cost and heuristic first."""
+
+    return bestFirstSearch(problem, heuristic)     # f(n) = g(n) + h(n)
+
+    util.raiseNotDefined()
+
+
+def bestFirstSearch(problem, heuristic=nullHeuristic):
+    """
+    Graph search core shared by UCS and A*: repeatedly expands the frontier node
+    with the lowest f(n) = g(n) + h(n).
+
+    Explored states are kept in a hash set and the frontier is an
+    util.IndexedPriorityQueue of states plus an index state -> node holding
+    its best known g(n), so membership tests are O(1) and a cheaper path to a
+    state already in the frontier is a single O(log n) decrease-key.
+
+    g(n) is accumulated from the step costs returned by getSuccessors, so each
+    push is O(1); set VERIFY_PATH_COST to check the result against
+    problem.getCostOfActions.
+    """
+
+    nodes = SearchNodes()  # Parent pointers and g(n) of every generated node
+    startState = problem.getStartState()
+    explored = set()  # Hashed closed set of all explored states
+    frontierNode = {startState: nodes.add(None, None, 0)}  # Frontier index: state -> node with best g(n)
+    frontier = util.IndexedPriorityQueue()  # Frontier states ordered by f(n)
+    frontier.push(startState, heuristic(startState, problem))
 
     while not frontier.isEmpty():  # Break loop if Queue is empty
-        state, path = frontier.pop()
+        state = frontier.pop()
+        node = frontierNode.pop(state)
 
         if problem.isGoalState(state):  # If goal is reached return path
+            path = nodes.path(node)
+            if VERIFY_PATH_COST:
+                verifyPathCost(problem, path, nodes.costs[node])
             return path
 
-        explored.append(state)  # add state to explores list
+        explored.add(state)  # add state to explored set
         successors = problem.getSuccessors(state)  # Get all successors of current state
 
-        for childState, direction, _ in successors:
-            if childState not in explored:      # For all non visited successors
-                newPath = path + [direction]    # Path to childState
-                newPriority = problem.getCostOfActions(newPath)     # Priority of childState based on new path
+        for childState, direction, stepCost in successors:
+            if childState in explored:  # Skip already explored successors
+                continue
 
-                if childState not in (node[0] for _, _, node in frontier.heap):     # If childState already in frontier
-                    frontier.push((childState, newPath), newPriority)
-                else:                                   # if childState not in frontier push it
-                    for _, _, node in frontier.heap:    # Find childState in frontier
-                        if node[0] == childState:
-                            currentPriority = problem.getCostOfActions(node[1])     # Get priority
-                            break
+            cost = nodes.costs[node] + stepCost  # g(n) of childState through the current node
 
-                    if newPriority < currentPriority:   # If new priority better update node with new path
-                        frontier.update((childState, newPath), newPriority)
+            # Push childState if it is not in the frontier, or lower its priority if the new path is cheaper
+            if childState not in frontierNode or cost < nodes.costs[frontierNode[childState]]:
+                frontierNode[childState] = nodes.add(node, direction, cost)
+                frontier.update(childState, cost + heuristic(childState, problem))
 
     return []  # Error (Can't find solution)
 
-    util.raiseNotDefined()
-
 
-def nullHeuristic(state, problem=None):
+def bidirectionalSearch(problem):
     """
-    A heuristic function estimates the cost from the current state to the nearest
-    goal in the provided SearchProblem.  This heuristic is trivial.
+    Search forward from the start and backward from the goal at the same time,
+    stopping when the two searches meet on a cheapest path.
+
+    Works on problems with a single goal state, problem.goal, that also provide
+    getPredecessors(state) (such as PositionSearchProblem).  Each step expands
+    the side with the smaller frontier in uniform cost order; with unit costs
+    this is a bidirectional BFS.  Expansions of both sides are counted by the
+    problem as usual.
     """
-    return 0
 
+    if not hasattr(problem, 'goal') or not hasattr(problem, 'getPredecessors'):
+        raise Exception('bidirectionalSearch needs a problem with a single goal and getPredecessors')
 
-def aStarSearch(problem, heuristic=nullHeuristic):
-    """Search the node that has the lowest combined cost and heuristic first."""
+    startState, goalState = problem.getStartState(), problem.goal
+    if startState == goalState:
+        return []
 
-    priorityFunc = lambda node: problem.getCostOfActions(node[1]) + heuristic(node[0], problem)  # f(n) = g(n) + h(n)
+    # One (nodes, reached, explored, frontier, expand) search per direction; reached maps every state
+    # seen by that side to the node with its best g(n), where g(n) is the cost to (or from) the root
+    searches = []
+    for root, expand in [(startState, problem.getSuccessors), (goalState, problem.getPredecessors)]:
+        nodes = SearchNodes()
+        frontier = util.IndexedPriorityQueue()
+        frontier.push(root, 0)
+        searches.append((nodes, {root: nodes.add(None, None, 0)}, set(), frontier, expand))
 
-    explored = []  # Keeps track of all explored states
-    frontier = util.PriorityQueueWithFunction(priorityFunc)  # Use Priority Queue with func as frontier
-    frontier.push((problem.getStartState(), []))  # Init frontier with (start state,[])
+    bestCost, meetingState = float('inf'), None  # Cheapest start-to-goal path found so far
+    forwardFrontier, backwardFrontier = searches[0][3], searches[1][3]
 
-    while not frontier.isEmpty():  # Break loop if Queue is empty
-        state, path = frontier.pop()
+    while not forwardFrontier.isEmpty() and not backwardFrontier.isEmpty():
+        # No path through unexpanded states can beat bestCost once the two frontier minima add up to it
+        if forwardFrontier.heap[0][0] + backwardFrontier.heap[0][0] >= bestCost:
+            break
 
-        if state not in explored:  # If state already explored skip it
-            if problem.isGoalState(state):  # If goal is reached return path
-                return path
+        side = 0 if len(forwardFrontier) <= len(backwardFrontier) else 1
+        nodes, reached, explored, frontier, expand = searches[side]
+        otherNodes, otherReached = searches[1 - side][:2]
 
-            explored.append(state)  # add state to explores list
-            successors = problem.getSuccessors(state)  # Get all successors of current state
+        state = frontier.pop()
+        node = reached[state]
+        explored.add(state)
 
-            for childState, direction, _ in successors:  # Push all unexplored successors to frontier
-                if childState not in explored:
-                    frontier.push((childState, path + [direction]))
+        for childState, direction, stepCost in expand(state):
+            if childState in explored:
+                continue
 
-    return []  # Error (Can't find solution)
+            cost = nodes.costs[node] + stepCost
+            if childState not in reached or cost < nodes.costs[reached[childState]]:
+                reached[childState] = nodes.add(node, direction, cost)
+                frontier.update(childState, cost)
 
-    util.raiseNotDefined()
+                if childState in otherReached:  # The two searches meet at childState
+                    totalCost = cost + otherNodes.costs[otherReached[childState]]
+                    if totalCost < bestCost:
+                        bestCost, meetingState = totalCost, childState
+
+    if meetingState is None:
+        return []  # Error (Can't find solution)
+
+    problem.isGoalState(goalState)  # Lets the problem run its usual goal bookkeeping (e.g. display)
+
+    (forwardNodes, forwardReached), (backwardNodes, backwardReached) = [search[:2] for search in searches]
+    backwardPath = backwardNodes.path(backwardReached[meetingState])  # Actions from the goal back to meetingState
+    backwardPath.reverse()
+    return forwardNodes.path(forwardReached[meetingState]) + backwardPath
+
+
+def verifyPathCost(problem, path, cost):
+    """
+    Raises an exception if the accumulated cost of a path disagrees with
+    problem.getCostOfActions(path).
+    """
+    expected = problem.getCostOfActions(path)
+    if abs(expected - cost) > 1e-9 * max(1, abs(expected)):
+        raise Exception('Accumulated path cost %s does not match getCostOfActions %s' % (cost, expected))
 
 
 # Abbreviations
@@ -214,3 +334,4 @@ bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
+bds = bidirectionalSearch
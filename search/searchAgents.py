@@ -37,9 +37,11 @@ Good luck and happy searching!
 from game import Directions
 from game import Agent
 from game import Actions
+from game import Bitboard
 import util
 import time
 import search
+import distanceCalculator
 
 class GoWestAgent(Agent):
     "An agent that goes West until it can't."
@@ -68,6 +70,7 @@ class SearchAgent(Agent):
     Options for fn include:
       depthFirstSearch or dfs
       breadthFirstSearch or bfs
+      bidirectionalSearch or bds (PositionSearchProblem only)
 
 
     Note: You should NOT change any code in SearchAgent
@@ -153,6 +156,7 @@ class PositionSearchProblem(search.SearchProblem):
         goal: A position in the gameState
         """
         self.walls = gameState.getWalls()
+        self.neighborTable = Actions.getNeighborTable(self.walls)
         self.startState = gameState.getPacmanPosition()
         if start != None: self.startState = start
         self.goal = goal
@@ -193,14 +197,37 @@ class PositionSearchProblem(search.SearchProblem):
         """
 
         successors = []
+        x,y = state
+        for nextState, action in self.neighborTable[x * self.walls.height + y]:
+            cost = self.costFn(nextState)
+            successors.append( ( nextState, action, cost) )
+
+        # Bookkeeping for display purposes
+        self._expanded += 1 # DO NOT CHANGE
+        if state not in self._visited:
+            self._visited[state] = True
+            self._visitedlist.append(state)
+
+        return successors
+
+    def getPredecessors(self, state):
+        """
+        Returns the states from which 'state' can be reached in one step, for
+        searching backward from the goal.
+
+        Like getSuccessors, this returns a list of triples (predecessor, action,
+        stepCost), but here 'action' leads from the predecessor to 'state' and
+        'stepCost' is the cost of stepping into 'state'.
+        """
+
+        predecessors = []
+        x,y = state
+        cost = self.costFn(state)
         for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state
             dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextState = (nextx, nexty)
-                cost = self.costFn(nextState)
-                successors.append( ( nextState, action, cost) )
+            prevx, prevy = int(x - dx), int(y - dy)
+            if not self.walls[prevx][prevy]:
+                predecessors.append( ( (prevx, prevy), action, cost) )
 
         # Bookkeeping for display purposes
         self._expanded += 1 # DO NOT CHANGE
@@ -208,7 +235,7 @@ class PositionSearchProblem(search.SearchProblem):
             self._visited[state] = True
             self._visitedlist.append(state)
 
-        return successors
+        return predecessors
 
     def getCostOfActions(self, actions):
         """
@@ -278,6 +305,7 @@ class CornersProblem(search.SearchProblem):
         Stores the walls, pacman's starting position and corners.
         """
         self.walls = startingGameState.getWalls()
+        self.neighborTable = Actions.getNeighborTable(self.walls)
         self.startingPosition = startingGameState.getPacmanPosition()
         top, right = self.walls.height-2, self.walls.width-2
         self.corners = ((1,1), (1,top), (right, 1), (right, top))
@@ -288,13 +316,23 @@ class CornersProblem(search.SearchProblem):
         # Please add any code here which you would like to use
         # in initializing the problem
 
+        # A search state is (position, visitedMask) where bit i of visitedMask is set once
+        # self.corners[i] has been visited, so states hash and compare in O(1)
+        self.allVisited = (1 << len(self.corners)) - 1
+        self.cornerBits = {}    # corner position -> bits of that corner (corners coincide in tiny mazes)
+        for i, corner in enumerate(self.corners):
+            self.cornerBits[corner] = self.cornerBits.get(corner, 0) | (1 << i)
+        # visitedMask -> corners still to visit, shared by cornersHeuristic
+        self.remainingCorners = [tuple(corner for i, corner in enumerate(self.corners) if not mask & (1 << i))
+                                 for mask in range(self.allVisited + 1)]
+
     def getStartState(self):
         """
         Returns the start state (in your state space, not the full Pacman state
         space)
         """
 
-        return (self.startingPosition, list(self.corners))   # Return node with start position and unvisited corners
+        return (self.startingPosition, 0)   # Return node with start position and no visited corners
 
         util.raiseNotDefined()
 
@@ -302,7 +340,7 @@ class CornersProblem(search.SearchProblem):
         """
         Returns whether this search state is a goal state of the problem.
         """
-        return state[1] == []   # returns True if no corners remaining in list
+        return state[1] == self.allVisited   # returns True if every corner has been visited
 
         util.raiseNotDefined()
 
@@ -318,26 +356,11 @@ class CornersProblem(search.SearchProblem):
         """
 
         successors = []
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            # Add a successor state to the successor list if the action is legal
-            # Here's a code snippet for figuring out whether a new position hits a wall:
-            #   x,y = currentPosition
-            #   dx, dy = Actions.directionToVector(action)
-            #   nextx, nexty = int(x + dx), int(y + dy)
-            #   hitsWall = self.walls[nextx][nexty]
-
-            x, y = state[0]
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-
-            if not self.walls[nextx][nexty]:
-                nextState = (nextx, nexty)
-                newDests = list(state[1])       # copy remaining dest list from predecessor node
-
-                if nextState in state[1]:       # if next state is destination state remove from newDests
-                    newDests.remove(nextState)
-
-                successors.append(((nextState, newDests), action, 1))
+        (x, y), visited = state
+        # The neighbor table holds the legal (nextState, action) moves out of every cell
+        for nextState, action in self.neighborTable[x * self.walls.height + y]:
+            nextVisited = visited | self.cornerBits.get(nextState, 0)     # mark nextState visited if it is a corner
+            successors.append(((nextState, nextVisited), action, 1))
 
         self._expanded += 1     # DO NOT CHANGE
         return successors
@@ -372,20 +395,16 @@ def cornersHeuristic(state, problem):
     corners = problem.corners   # These are the corner coordinates
     walls = problem.walls   # These are the walls of the maze, as a Grid (game.py)
 
-    position, destinations = state
+    (x, y), visited = state
+    destinations = problem.remainingCorners[visited]    # Corners not visited yet
 
     # Return 0 if all corner dots eaten
-    if problem.isGoalState(state):
+    if not destinations:
         return 0
 
     # "3/3 autograder"
-    # Calculate manhattan distance of position from each remaining destination
-    distance = map(
-        lambda corner: util.manhattanDistance(position, corner),
-        list(destinations)
-    )
-
-    return max(distance)    # Return greatest manhattan distance from destinations as heuristic
+    # Return greatest manhattan distance from remaining destinations as heuristic
+    return max([abs(x - cornerX) + abs(y - cornerY) for cornerX, cornerY in destinations])
 
     # "2/3 autograder"
     # avg = reduce(lambda a, b: a + b, distance, 0) / len(dests)
@@ -404,11 +423,15 @@ class FoodSearchProblem:
 
     A search state in this problem is a tuple ( pacmanPosition, foodGrid ) where
       pacmanPosition: a tuple (x,y) of integers specifying Pacman's position
-      foodGrid:       a Grid (see game.py) of either True or False, specifying remaining food
+      foodGrid:       a Bitboard (see game.py) of either True or False, specifying remaining food
+
+    The Bitboard reads like a Grid (foodGrid[x][y], asList, count) but hashes
+    and copies in O(1), which keeps the closed set of a food search cheap.
     """
     def __init__(self, startingGameState):
-        self.start = (startingGameState.getPacmanPosition(), startingGameState.getFood())
+        self.start = (startingGameState.getPacmanPosition(), Bitboard.fromGrid(startingGameState.getFood()))
         self.walls = startingGameState.getWalls()
+        self.neighborTable = Actions.getNeighborTable(self.walls)
         self.startingGameState = startingGameState
         self._expanded = 0  # DO NOT CHANGE
         self.heuristicInfo = {}     # A dictionary for the heuristic to store information
@@ -423,14 +446,10 @@ class FoodSearchProblem:
         "Returns successor states, the actions they require, and a cost of 1."
         successors = []
         self._expanded += 1 # DO NOT CHANGE
-        for direction in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state[0]
-            dx, dy = Actions.directionToVector(direction)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextFood = state[1].copy()
-                nextFood[nextx][nexty] = False
-                successors.append( ( ((nextx, nexty), nextFood), direction, 1) )
+        (x,y), food = state
+        for nextState, direction in self.neighborTable[x * self.walls.height + y]:
+            nextFood = food.clear(nextState[0], nextState[1])
+            successors.append( ( (nextState, nextFood), direction, 1) )
         return successors
 
     def getCostOfActions(self, actions):
@@ -466,9 +485,9 @@ def foodHeuristic(state, problem):
     other hand, inadmissible or inconsistent heuristics may find optimal
     solutions, so be careful.
 
-    The state is a tuple ( pacmanPosition, foodGrid ) where foodGrid is a Grid
-    (see game.py) of either True or False. You can call foodGrid.asList() to get
-    a list of food coordinates instead.
+    The state is a tuple ( pacmanPosition, foodGrid ) where foodGrid is a Bitboard
+    (see game.py) of either True or False that can be read like a Grid. You can
+    call foodGrid.asList() to get a list of food coordinates instead.
 
     If you want access to info like walls, capsules, etc., you can query the
     problem.  For example, problem.walls gives you a Grid of where the walls
@@ -505,7 +524,7 @@ class ClosestDotSearchAgent(SearchAgent):
     def registerInitialState(self, state):
         self.actions = []
         currentState = state
-        while(currentState.getFood().count() > 0):
+        while(currentState.getNumFood() > 0):
             nextPathSegment = self.findPathToClosestDot(currentState) # The missing piece
             self.actions += nextPathSegment
             for action in nextPathSegment:
@@ -554,6 +573,7 @@ class AnyFoodSearchProblem(PositionSearchProblem):
 
         # Store info for the PositionSearchProblem (no need to change this)
         self.walls = gameState.getWalls()
+        self.neighborTable = Actions.getNeighborTable(self.walls)
         self.startState = gameState.getPacmanPosition()
         self.costFn = lambda x: 1
         self._visited, self._visitedlist, self._expanded = {}, [], 0 # DO NOT CHANGE
@@ -571,12 +591,15 @@ class AnyFoodSearchProblem(PositionSearchProblem):
 
 def mazeDistance(point1, point2, gameState):
     """
-    Returns the maze distance between any two points, using the search functions
-    you have already built. The gameState can be any game state -- Pacman's
-    position in that state is ignored.
+    Returns the maze distance between any two points. The gameState can be any
+    game state -- Pacman's position in that state is ignored.
 
     Example usage: mazeDistance( (2,4), (5,6), gameState)
 
+    Distances are looked up in an all-pairs table (see distanceCalculator.py)
+    that is built once per maze and shared by every problem on the same walls.
+    Like a search that finds no path, an unreachable point2 gives 0.
+
     This might be a useful helper function for your ApproximateSearchAgent.
     """
     x1, y1 = point1
@@ -584,5 +607,6 @@ def mazeDistance(point1, point2, gameState):
     walls = gameState.getWalls()
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
-    prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return len(search.bfs(prob))
+    distance = distanceCalculator.getMazeDistances(walls).getDistance(point1, point2)
+    if distance is None: return 0
+    return distance
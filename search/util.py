@@ -222,6 +222,101 @@ class PriorityQueueWithFunction(PriorityQueue):
         "Adds an item to the queue with priority from the priority function"
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
+class IndexedPriorityQueue:
+    """
+      A priority queue that remembers where each item sits in its heap, so the
+      priority of an item already in the queue can be changed in O(log n)
+      instead of the linear scan and heapify done by PriorityQueue.update.
+
+      push, pop and update are O(log n); isEmpty and membership tests
+      ('item in queue') are O(1).  Items must be hashable and appear in the
+      queue at most once.  Items of equal priority come out first-in
+      first-out, and an item whose priority is lowered by update is ordered
+      as if it had just been pushed.
+    """
+    def  __init__(self):
+        self.heap = []
+        self.position = {}  # item -> index of its entry in self.heap
+        self.count = 0
+
+    def push(self, item, priority):
+        if item in self.position:
+            raise Exception('Item already in priority queue: ' + str(item))
+        self.heap.append((priority, self.count, item))
+        self.count += 1
+        self.position[item] = len(self.heap) - 1
+        self._siftUp(len(self.heap) - 1)
+
+    def pop(self):
+        last = self.heap.pop()
+        if self.heap:
+            (_, _, item) = self.heap[0]
+            self.heap[0] = last
+            self.position[last[2]] = 0
+            self._siftDown(0)
+        else:
+            item = last[2]
+        del self.position[item]
+        return item
+
+    def isEmpty(self):
+        return len(self.heap) == 0
+
+    def update(self, item, priority):
+        # Same contract as PriorityQueue.update:
+        # If item already in priority queue with higher priority, lower its priority.
+        # If item already in priority queue with equal or lower priority, do nothing.
+        # If item not in priority queue, do the same thing as self.push.
+        if item not in self.position:
+            self.push(item, priority)
+            return
+        index = self.position[item]
+        if self.heap[index][0] <= priority:
+            return
+        self.heap[index] = (priority, self.count, item)
+        self.count += 1
+        self._siftUp(index)
+
+    def getPriority(self, item):
+        "Returns the current priority of an item in the queue"
+        return self.heap[self.position[item]][0]
+
+    def __contains__(self, item):
+        return item in self.position
+
+    def __len__(self):
+        return len(self.heap)
+
+    def _siftUp(self, index):
+        heap, position = self.heap, self.position
+        entry = heap[index]
+        while index > 0:
+            parent = (index - 1) >> 1
+            if heap[parent] <= entry:
+                break
+            heap[index] = heap[parent]
+            position[heap[index][2]] = index
+            index = parent
+        heap[index] = entry
+        position[entry[2]] = index
+
+    def _siftDown(self, index):
+        heap, position = self.heap, self.position
+        size = len(heap)
+        entry = heap[index]
+        child = 2 * index + 1
+        while child < size:
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if entry <= heap[child]:
+                break
+            heap[index] = heap[child]
+            position[heap[index][2]] = index
+            index = child
+            child = 2 * index + 1
+        heap[index] = entry
+        position[entry[2]] = index
+
 
 def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"